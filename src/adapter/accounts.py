@@ -0,0 +1,89 @@
+from logging import getLogger
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import TTLCache
+from .models import AdminAccount, ServiceAccount
+
+logger = getLogger('django')
+
+
+class AccountCache:
+    """
+    Cache of company -> service account and its admin accounts.
+
+    Lookups go through an in-process TTL cache and, if enabled, the shared Django cache before the database.
+    Entries are invalidated by post_save/post_delete signals (see signals.py): the local cache is cleared and the
+    shared cache generation is bumped, so other processes pick up changes once their local entries expire.
+    """
+    GENERATION_KEY = 'adapter:accounts:generation'
+
+    def __init__(self, max_size=1000, ttl=60, shared=False, shared_ttl=3600):
+        self.local = TTLCache(max_size=max_size, ttl=ttl)
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+
+    def _shared_key(self, company: str) -> str:
+        generation = cache.get(self.GENERATION_KEY, 0)
+        return 'adapter:accounts:%s:%s' % (generation, company)
+
+    def get(self, company: str):
+        """
+        Returns a (service_account, admin_accounts) tuple for the company.
+        Raises ServiceAccount.DoesNotExist if the company has no service account.
+        """
+        entry = self.local.get(company)
+        if entry is not None:
+            return entry
+
+        if self.shared:
+            key = self._shared_key(company)
+            entry = cache.get(key)
+
+        if entry is None:
+            service_account = ServiceAccount.objects.get(company=company)
+            admin_accounts = list(service_account.adminaccount_set.all())
+            for account in admin_accounts:
+                account.service_account = service_account
+            entry = (service_account, admin_accounts)
+
+            if self.shared:
+                cache.set(key, entry, self.shared_ttl)
+
+        self.local.set(company, entry)
+        return entry
+
+    def get_service_account(self, company: str) -> ServiceAccount:
+        return self.get(company)[0]
+
+    def get_admin_account(self, company: str, name: str = None, type: str = 'deposit') -> AdminAccount:
+        """
+        Returns the named admin account of the company, or its default account of the given type.
+        Raises AdminAccount.DoesNotExist or AdminAccount.MultipleObjectsReturned like a queryset get().
+        """
+        service_account, admin_accounts = self.get(company)
+
+        if name:
+            matches = [account for account in admin_accounts if account.name == name]
+        else:
+            matches = [account for account in admin_accounts if account.type == type and account.default]
+
+        if not matches:
+            raise AdminAccount.DoesNotExist('No admin account %s for %s.' % (name or type, company))
+        if len(matches) > 1:
+            raise AdminAccount.MultipleObjectsReturned('Multiple admin accounts %s for %s.' % (name or type, company))
+
+        return matches[0]
+
+    def invalidate(self):
+        self.local.clear()
+
+        if self.shared:
+            cache.add(self.GENERATION_KEY, 0, None)
+            cache.incr(self.GENERATION_KEY)
+
+
+account_cache = AccountCache(max_size=getattr(settings, 'ADAPTER_ACCOUNT_CACHE_SIZE', 1000),
+                             ttl=getattr(settings, 'ADAPTER_ACCOUNT_CACHE_TTL', 60),
+                             shared=getattr(settings, 'ADAPTER_ACCOUNT_CACHE_SHARED', False))
@@ -1,30 +1,128 @@
 from django.contrib import admin
+from django.contrib.postgres.fields import JSONField
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models import Q
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils.functional import cached_property
 
-from .models import User, AdminAccount, Transaction, ServiceAccount
+from .models import User, AdminAccount, ArchivedTransaction, RehiveResponse, Transaction, ServiceAccount
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the planner's row estimate instead of an exact COUNT(*) once it is above `estimate_threshold`, so changelists
+    of large tables don't scan the whole table (or filter) to number their pages.
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+        if estimate < self.estimate_threshold:
+            return super(EstimatedCountPaginator, self).count
+        return estimate
 
 
 class CustomModelAdmin(admin.ModelAdmin):
     def __init__(self, model, admin_site):
-        self.list_display = [field.name for field in model._meta.fields]
+        # JSON and binary columns (secrets, metadata, payloads) are left out of changelists.
+        self.list_display = [field.name for field in model._meta.fields
+                             if not isinstance(field, (JSONField, models.BinaryField))]
         super(CustomModelAdmin, self).__init__(model, admin_site)
 
 
-class UserAdmin(CustomModelAdmin):
-    pass
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables with millions of rows: estimated page counts, no unfiltered total and exact,
+    indexed lookups for search instead of icontains scans over every row.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+    # Fields matched exactly by the search box, and integer fields matched by purely numeric terms.
+    exact_search_fields = ()
+    numeric_search_fields = ('id',)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+
+        query = Q()
+        for field in self.exact_search_fields:
+            query |= Q(**{field: term})
+        if term.isdigit():
+            for field in self.numeric_search_fields:
+                query |= Q(**{field: int(term)})
+
+        # An empty Q() would match every row.
+        if not query:
+            return queryset.none(), False
+
+        return queryset.filter(query), False
+
+
+class UserAdmin(LargeTableAdmin):
+    list_display = ('id', 'identifier', 'email', 'first_name', 'last_name', 'mobile_number', 'company', 'created')
+    search_fields = ('identifier', 'company')
+    exact_search_fields = ('identifier', 'company')
 
 
 class AdminAccountAdmin(CustomModelAdmin):
-    pass
+    list_select_related = ('service_account',)
 
 
 class ServiceAccountAdmin(CustomModelAdmin):
     pass
 
 
-class TransactionAdmin(CustomModelAdmin):
-    pass
+class TransactionAdmin(LargeTableAdmin):
+    list_display = ('id', 'created', 'user', 'account', 'tx_type', 'status', 'amount', 'fee', 'currency',
+                    'rehive_code', 'external_id', 'updated')
+    list_select_related = ('user', 'admin_account__service_account')
+    list_filter = ('status', 'tx_type', 'created')
+    raw_id_fields = ('user', 'admin_account')
+    search_fields = ('rehive_code', 'external_id')
+    exact_search_fields = ('rehive_code', 'external_id')
+
+    def get_queryset(self, request):
+        return super(TransactionAdmin, self).get_queryset(request).defer('metadata',
+                                                                         'admin_account__secret',
+                                                                         'admin_account__metadata')
+
+    def account(self, tx):
+        return '%s (%s)' % (tx.admin_account.name, tx.admin_account.service_account)
+    account.admin_order_field = 'admin_account'
+
+
+class ArchivedTransactionAdmin(TransactionAdmin):
+    list_display = TransactionAdmin.list_display + ('archived',)
+
+
+class RehiveResponseAdmin(LargeTableAdmin):
+    list_display = ('id', 'transaction_id', 'action', 'status_code', 'created')
+    list_filter = ('action', 'status_code')
+    raw_id_fields = ('transaction',)
+    search_fields = ('transaction__id',)
+    numeric_search_fields = ('transaction_id',)
+
+    def get_queryset(self, request):
+        return super(RehiveResponseAdmin, self).get_queryset(request).defer('data', 'compressed')
+
 
 admin.site.register(User, UserAdmin)
 admin.site.register(AdminAccount, AdminAccountAdmin)
 admin.site.register(Transaction, TransactionAdmin)
+admin.site.register(ArchivedTransaction, ArchivedTransactionAdmin)
+admin.site.register(RehiveResponse, RehiveResponseAdmin)
 admin.site.register(ServiceAccount, ServiceAccountAdmin)
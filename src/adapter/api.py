@@ -1,15 +1,45 @@
+import asyncio
+import functools
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 from logging import getLogger
 
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from .cache import TTLCache
+from .metrics import INTERFACE_LATENCY, timed
 from .models import Transaction
+from .utils import to_cents
 
 logger = getLogger('django')
 
 
+def run_in_thread(fn, *args, **kwargs):
+    """
+    Calls a blocking function and closes the database connections it opened in its (executor) thread.
+    """
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
 class AbstractBaseInteface:
     """
     Template for Interface to handle all API calls to third-party account.
+
+    The `a`-prefixed coroutines are the async API. By default they run the blocking methods in the event loop's
+    executor, so existing interfaces work unchanged; interfaces with a native async client can override them.
     """
 
+    # Transactions of a single account that may execute at the same time (e.g. 1 for sequence numbered wallets).
+    account_concurrency = 1
+
     def __init__(self, account):
         # Always linked to an AdminAccount
         self.account = account
@@ -53,11 +83,51 @@ class AbstractBaseInteface:
         """
         raise NotImplementedError('subclasses of AbstractBaseUser must provide a get_account_balance() method')
 
+    async def _run_sync(self, fn, *args, **kwargs):
+        loop = asyncio.get_event_loop()  # The running loop inside a coroutine (get_running_loop needs Python 3.7)
+        return await loop.run_in_executor(None, functools.partial(run_in_thread, fn, *args, **kwargs))
+
+    async def aget_user_ref(self, user) -> dict:
+        return await self._run_sync(self.get_user_ref, user)
+
+    async def aget_account_ref(self) -> dict:
+        return await self._run_sync(self.get_account_ref)
+
+    async def aget_account_balance(self) -> dict:
+        return await self._run_sync(self.get_account_balance)
+
+    async def aexecute(self, tx: Transaction) -> dict:
+        return await self._run_sync(self.execute, tx)
+
 
 class StellarInterface(AbstractBaseInteface):
     """
-    Interface implementation.
+    Interface implementation. The admin account's Stellar address (public key) is read from `account_id` in its
+    metadata, balances are read from Horizon (STELLAR_HORIZON_URL).
     """
+    # Stellar amounts have 7 decimal places.
+    divisibility = 7
+
+    def get_account_id(self) -> str:
+        account_id = (self.account.metadata or {}).get('account_id')
+        if not account_id:
+            raise ImproperlyConfigured('Admin account %s has no Stellar account_id in its metadata.' % self.account.id)
+        return account_id
+
+    def get_account_ref(self) -> dict:
+        return {'reference': self.get_account_id(),
+                'details': {'horizon_url': getattr(settings, 'STELLAR_HORIZON_URL', 'https://horizon.stellar.org/')}}
+
+    def get_account_balance(self) -> dict:
+        horizon_url = getattr(settings, 'STELLAR_HORIZON_URL', 'https://horizon.stellar.org/')
+        r = requests.get(horizon_url.rstrip('/') + '/accounts/' + self.get_account_id(),
+                         timeout=getattr(settings, 'STELLAR_HORIZON_TIMEOUT', 10))
+        r.raise_for_status()
+
+        balance = next(balance['balance'] for balance in r.json()['balances'] if balance['asset_type'] == 'native')
+        return {'balance': to_cents(Decimal(balance), self.divisibility),
+                'currency': 'XLM'}
+
     def execute(self, tx: Transaction):
         tx.status = 'Complete'
 
@@ -67,3 +137,78 @@ class StellarInterface(AbstractBaseInteface):
 INTERFACES = {
     'stellar': StellarInterface
 }
+
+
+class InterfaceRegistry:
+    """
+    Builds and reuses one interface instance per AdminAccount.
+
+    Instances are keyed by account id and stamped with a fingerprint of the account's interface, secret and
+    metadata, so an edited account gets a fresh instance even in processes that missed the invalidation signal.
+    The least recently used instances are evicted past `max_size`.
+    """
+
+    def __init__(self, interfaces: dict, max_size=256, ttl=3600):
+        self.interfaces = interfaces
+        self.instances = TTLCache(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def get_stamp(account) -> str:
+        data = json.dumps([account.interface, account.secret, account.metadata], sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get(self, account) -> AbstractBaseInteface:
+        stamp = self.get_stamp(account)
+        entry = self.instances.get(account.id)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        interface = self.interfaces[account.interface](account=account)
+        self.instances.set(account.id, (stamp, interface))
+        return interface
+
+    def invalidate(self, account_id: int):
+        self.instances.invalidate(account_id)
+
+
+interfaces = InterfaceRegistry(INTERFACES,
+                               max_size=getattr(settings, 'ADAPTER_INTERFACE_CACHE_SIZE', 256),
+                               ttl=getattr(settings, 'ADAPTER_INTERFACE_CACHE_TTL', 3600))
+
+
+def execute_concurrently(txs: list, concurrency: int = None) -> list:
+    """
+    Executes transactions with their third-party interfaces concurrently on an asyncio event loop, at most
+    `concurrency` at a time overall and `account_concurrency` at a time per admin account (in list order).
+    Returns the exception raised by each transaction's execution, or None if it succeeded.
+    """
+    concurrency = concurrency or getattr(settings, 'ADAPTER_EXECUTE_CONCURRENCY', 10)
+
+    async def execute(tx, limit, account_limits):
+        interface = interfaces.get(tx.admin_account)
+        account_limit = account_limits.setdefault(tx.admin_account_id,
+                                                  asyncio.Semaphore(interface.account_concurrency))
+        async with account_limit:
+            async with limit:
+                try:
+                    with timed(INTERFACE_LATENCY, record_outcome=True, interface=tx.admin_account.interface,
+                               method='aexecute'):
+                        await interface.aexecute(tx)
+                except Exception as e:
+                    return e
+
+    async def execute_all():
+        limit = asyncio.Semaphore(concurrency)
+        account_limits = {}
+        return await asyncio.gather(*[execute(tx, limit, account_limits) for tx in txs])
+
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    loop.set_default_executor(executor)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(execute_all())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        executor.shutdown(wait=True)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AdapterConfig(AppConfig):
     name = 'adapter'
+
+    def ready(self):
+        from . import checks, signals  # noqa
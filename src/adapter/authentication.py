@@ -1,3 +1,8 @@
+import base64
+import hashlib
+import time
+
+import jwt
 import requests
 import json
 
@@ -6,41 +11,129 @@ from django.utils.translation import ugettext_lazy as _
 from django.utils.encoding import smart_text
 from rest_framework import authentication, exceptions
 
+from .accounts import account_cache
+from .cache import TTLCache
+from .metrics import JWT_VERIFY_LATENCY
 from .models import User, ServiceAccount
+from .rehive_client import get_client
+
+# Verified Rehive JWT payloads, keyed by token hash.
+jwt_cache = TTLCache(max_size=getattr(settings, 'REHIVE_JWT_CACHE_SIZE', 10000),
+                     ttl=getattr(settings, 'REHIVE_JWT_CACHE_TTL', 300))
+
+
+def get_token_key(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def get_token_expiry(token: str):
+    """
+    Returns the `exp` claim of a JWT without verifying it, or None if it cannot be read.
+    Only used to bound how long a verified token may be cached.
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload.encode('ascii')).decode('utf-8'))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+# Claims a locally verified token must carry to be used without asking Rehive.
+USER_CLAIMS = ('identifier', 'company', 'first_name', 'last_name', 'email', 'mobile_number', 'profile')
+
+
+def verify_token_locally(token: str):
+    """
+    Verifies the token signature and claims against the configured REHIVE_JWT_KEYS.
+    Returns data in the same form as Rehive's verify endpoint, or None if the token can't be verified locally
+    (unknown key or missing user claims) and Rehive must be asked instead.
+    """
+    keys = getattr(settings, 'REHIVE_JWT_KEYS', {})
+
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed(_('Invalid user'))
+
+    key = keys.get(header.get('kid') or 'default')
+    if key is None:
+        return None
+
+    try:
+        claims = jwt.decode(token, key, algorithms=getattr(settings, 'REHIVE_JWT_ALGORITHMS', ['HS256']))
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed(_('Invalid user'))
+
+    user = claims.get('user')
+    if not isinstance(user, dict) or not all(field in user for field in USER_CLAIMS):
+        return None
+
+    return {'user': user}
+
+
+def invalidate_token(token: str):
+    """
+    Drops a token from the verification cache, e.g. on logout.
+    """
+    jwt_cache.invalidate(get_token_key(token))
 
 
 class ExternalJWTAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         token = self.get_jwt_value(request)
-        url = ''.join([getattr(settings, 'REHIVE_API_URL'), 'auth/jwt/verify/'])
 
-        try:
-            r = requests.post(url, json={"token": token})
+        if not token:
+            raise exceptions.AuthenticationFailed(_('Invalid user'))
 
-            if r.status_code == 200:
-                data = json.loads(r.text)
+        data = self.verify_token(token)
 
-                try:
-                    ServiceAccount.objects.get(company=data['user']['company'])
-                except ServiceAccount.DoesNotExist:
-                    raise exceptions.AuthenticationFailed(_("Inactive service"))
+        try:
+            account_cache.get_service_account(data['user']['company'])
+        except ServiceAccount.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_("Inactive service"))
 
-                user, created = User.objects.get_or_create(identifier=data['user']['identifier'])
-                user.first_name = data['user']['first_name']
-                user.last_name = data['user']['last_name']
-                user.email = data['user']['email']
-                user.mobile_number = data['user']['mobile_number']
-                user.profile = data['user']['profile']
-                user.company = data['user']['company']
-                user.save()
+        user = User.objects.sync_profile(data['user'])
 
-            else:
-                raise exceptions.AuthenticationFailed(_('Invalid user'))
+        return user, token  # authentication successful
 
+    @staticmethod
+    def verify_token(token):
+        """
+        Verifies the token, locally if configured, else with Rehive, and returns the user data. Successful
+        verifications are cached until the cache ttl or the token's expiry, whichever comes first.
+        """
+        start = time.perf_counter()
+        source = 'cache'
+
+        key = get_token_key(token)
+        data = jwt_cache.get(key)
+        if data is None:
+            if getattr(settings, 'REHIVE_JWT_VERIFICATION', 'remote') == 'local':
+                source = 'local'
+                data = verify_token_locally(token)
+
+            if data is None:
+                source = 'remote'
+                data = ExternalJWTAuthentication.verify_token_remotely(token)
+
+            expiry = get_token_expiry(token)
+            jwt_cache.set(key, data, ttl=None if expiry is None else expiry - time.time())
+
+        JWT_VERIFY_LATENCY.labels(source=source).observe(time.perf_counter() - start)
+        return data
+
+    @staticmethod
+    def verify_token_remotely(token):
+        try:
+            r = get_client().verify_token(token)
         except (requests.exceptions.RequestException, requests.exceptions.MissingSchema) as e:
             raise exceptions.AuthenticationFailed(e)
 
-        return user, token  # authentication successful
+        if r.status_code != 200:
+            raise exceptions.AuthenticationFailed(_('Invalid user'))
+
+        return json.loads(r.text)
 
     @staticmethod
     def get_jwt_value(request):
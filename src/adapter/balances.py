@@ -0,0 +1,81 @@
+import threading
+import time
+from logging import getLogger
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .checks import is_cache_shared
+
+logger = getLogger('django')
+
+
+class StaleWhileRevalidateCache:
+    """
+    Caches a third-party value per AdminAccount (e.g. its balance) in the Django cache.
+
+    The last known value is always served immediately. Values older than `max_age` trigger a single background
+    refresh (guarded by a cache lock); only accounts that were never fetched are fetched inline. Refreshes run as
+    celery tasks if the cache is shared, otherwise in a thread of the serving process, the only one that will read
+    the refreshed value.
+    """
+
+    def __init__(self, name: str, method: str, max_age: float, lock_timeout: float = 60):
+        self.name = name
+        self.method = method
+        self.max_age = max_age
+        self.lock_timeout = lock_timeout
+
+    def key(self, account_id: int) -> str:
+        return 'adapter:%s:%s' % (self.name, account_id)
+
+    def get(self, account) -> dict:
+        """
+        Returns {'value': ..., 'age': seconds since fetched, 'stale': bool}.
+        """
+        entry = cache.get(self.key(account.id))
+
+        if entry is None:
+            entry = self.refresh(account)
+        elif time.time() - entry['fetched'] > self.max_age:
+            self.schedule_refresh(account)
+
+        age = time.time() - entry['fetched']
+        return {'value': entry['value'], 'age': round(age, 3), 'stale': age > self.max_age}
+
+    def refresh(self, account) -> dict:
+        entry = {'value': getattr(account, self.method)(), 'fetched': time.time()}
+        cache.set(self.key(account.id), entry, None)
+        return entry
+
+    def schedule_refresh(self, account):
+        from .tasks import refresh_account_value
+
+        if not cache.add(self.key(account.id) + ':lock', True, self.lock_timeout):
+            return
+
+        if is_cache_shared():
+            refresh_account_value.delay(self.name, account.id)
+        else:
+            threading.Thread(target=refresh_in_process, args=(self.name, account.id), daemon=True).start()
+
+    def release(self, account_id: int):
+        cache.delete(self.key(account_id) + ':lock')
+
+
+def refresh_in_process(name: str, account_id: int):
+    from .tasks import refresh_account_value
+
+    try:
+        refresh_account_value(name, account_id)
+    finally:
+        connection.close()  # The thread's own connection.
+
+
+balance_cache = StaleWhileRevalidateCache('balance', 'get_account_balance',
+                                          max_age=getattr(settings, 'ADAPTER_BALANCE_MAX_AGE', 30))
+account_ref_cache = StaleWhileRevalidateCache('account_ref', 'get_account_ref',
+                                              max_age=getattr(settings, 'ADAPTER_ACCOUNT_REF_MAX_AGE', 3600))
+
+CACHES = {value_cache.name: value_cache for value_cache in (balance_cache, account_ref_cache)}
@@ -0,0 +1,106 @@
+"""
+Lightweight benchmark harness for adapter hot paths.
+
+Suites register themselves with the `benchmark` decorator and are run through the `benchmark` management command,
+which writes JSON results that can be compared between commits with `--compare`.
+"""
+import json
+import time
+
+SUITES = {}
+
+# Suites that need a (test) database.
+DB_SUITES = set()
+
+
+def benchmark(suite: str, name: str, db: bool = False):
+    """
+    Registers a benchmark. The decorated function receives the options dict and returns a zero argument callable
+    that performs a single iteration.
+    """
+    def decorator(setup):
+        SUITES.setdefault(suite, {})[name] = setup
+        if db:
+            DB_SUITES.add(suite)
+        return setup
+    return decorator
+
+
+class StubResponse:
+    """
+    Stands in for a requests response from Rehive.
+    """
+
+    def __init__(self, data, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(data)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def create_fixtures(company='bench', identifier='bench-user'):
+    """
+    Creates a service account with a default admin account and a user.
+    """
+    from ..models import AdminAccount, ServiceAccount, User
+
+    service_account, created = ServiceAccount.objects.get_or_create(company=company,
+                                                                    defaults={'token': company + '-token'})
+    admin_account, created = AdminAccount.objects.get_or_create(name='hot', service_account=service_account,
+                                                                defaults={'type': 'deposit',
+                                                                          'interface': 'stellar',
+                                                                          'default': True})
+    user, created = User.objects.get_or_create(identifier=identifier, defaults={'company': company})
+    return service_account, admin_account, user
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def measure(fn, iterations=1000, warmup=10) -> dict:
+    """
+    Runs fn `iterations` times and returns timing statistics in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t) * 1000)
+    total = time.perf_counter() - start
+
+    timings.sort()
+    return {'iterations': iterations,
+            'total_s': round(total, 6),
+            'mean_ms': round(sum(timings) / len(timings), 6),
+            'p50_ms': round(percentile(timings, 50), 6),
+            'p95_ms': round(percentile(timings, 95), 6),
+            'p99_ms': round(percentile(timings, 99), 6),
+            'ops_per_s': round(iterations / total, 2) if total else None}
+
+
+def compare(baseline: dict, results: dict, metric='p50_ms') -> list:
+    """
+    Returns (name, baseline, current, change %) rows for benchmarks present in both result sets.
+    """
+    rows = []
+    for name in sorted(set(baseline['results']) & set(results['results'])):
+        before = baseline['results'][name][metric]
+        after = results['results'][name][metric]
+        change = (after - before) / before * 100 if before else 0.0
+        rows.append((name, before, after, change))
+    return rows
+
+
+def load_suites():
+    # Import suite modules so they register themselves.
+    from . import authentication, serializers, transactions, uploads, utils  # noqa
+    return SUITES
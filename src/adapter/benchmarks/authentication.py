@@ -0,0 +1,91 @@
+import time
+import uuid
+from unittest import mock
+
+import jwt
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from . import StubResponse, benchmark, create_fixtures
+from ..accounts import account_cache
+from ..authentication import ExternalJWTAuthentication, jwt_cache
+from ..models import user_profile_cache
+
+SECRET = 'benchmark-secret'
+
+USER = {'identifier': 'bench-user', 'company': 'bench', 'first_name': 'Bench', 'last_name': 'User',
+        'email': 'bench@example.com', 'mobile_number': '+27000000000', 'profile': None}
+
+
+def make_token() -> str:
+    token = jwt.encode({'user': USER, 'exp': int(time.time()) + 3600, 'jti': uuid.uuid4().hex}, SECRET,
+                       algorithm='HS256')
+    return token.decode('utf-8') if isinstance(token, bytes) else token
+
+
+def stub_rehive(latency_ms: float):
+    def verify_token(*args, **kwargs):
+        time.sleep(latency_ms / 1000.0)
+        return StubResponse({'user': USER})
+    return mock.patch('adapter.rehive_client.RehiveClient.verify_token', verify_token)
+
+
+def uncached(mode: str, options: dict):
+    token = make_token()
+    stub = stub_rehive(options['latency'])
+    settings = override_settings(REHIVE_API_URL='http://rehive.local/',
+                                 REHIVE_JWT_VERIFICATION=mode,
+                                 REHIVE_JWT_KEYS={'default': SECRET})
+
+    def run():
+        jwt_cache.clear()
+        with stub, settings:
+            ExternalJWTAuthentication.verify_token(token)
+    return run
+
+
+@benchmark('authentication', 'verify_token_remote')
+def verify_token_remote(options):
+    return uncached('remote', options)
+
+
+@benchmark('authentication', 'verify_token_local')
+def verify_token_local(options):
+    return uncached('local', options)
+
+
+@benchmark('authentication', 'verify_token_cached')
+def verify_token_cached(options):
+    token = make_token()
+    with stub_rehive(options['latency']), override_settings(REHIVE_API_URL='http://rehive.local/'):
+        ExternalJWTAuthentication.verify_token(token)
+
+    def run():
+        ExternalJWTAuthentication.verify_token(token)
+    return run
+
+
+def authenticate(options, warm: bool):
+    create_fixtures(company=USER['company'], identifier=USER['identifier'])
+    request = RequestFactory().get('/', HTTP_AUTHORIZATION='JWT ' + make_token())
+    stub = stub_rehive(options['latency'])
+    authentication = ExternalJWTAuthentication()
+
+    def run():
+        if not warm:
+            jwt_cache.clear()
+            user_profile_cache.clear()
+            account_cache.invalidate()
+        with stub:
+            authentication.authenticate(request)
+    return run
+
+
+@benchmark('authentication', 'authenticate_cold', db=True)
+def authenticate_cold(options):
+    return authenticate(options, warm=False)
+
+
+@benchmark('authentication', 'authenticate_warm', db=True)
+def authenticate_warm(options):
+    return authenticate(options, warm=True)
@@ -0,0 +1,14 @@
+from . import benchmark
+from ..serializers import TransactionSerializer
+
+DATA = {'tx_code': 'TX', 'tx_type': 'withdraw', 'from_user': 'bench-user', 'to_user': 'bench-recipient',
+        'status': 'Pending', 'amount': '1000', 'fee': '0', 'currency': 'XLM', 'company': 'bench',
+        'created': '1484307000000', 'note': 'benchmark', 'metadata': {'reference': 'bench'}}
+
+
+@benchmark('serializers', 'transaction_serializer')
+def transaction_serializer(options):
+    def run():
+        serializer = TransactionSerializer(data=DATA)
+        serializer.is_valid(raise_exception=True)
+    return run
@@ -0,0 +1,22 @@
+from . import benchmark, create_fixtures
+from ..models import Transaction
+
+
+@benchmark('transactions', 'create_deposit', db=True)
+def create_deposit(options):
+    service_account, admin_account, user = create_fixtures()
+
+    def run():
+        Transaction.objects.create_deposit(user=user, from_reference='bench', amount=1000, currency='XLM',
+                                           note='', metadata={})
+    return run
+
+
+@benchmark('transactions', 'create_withdraw', db=True)
+def create_withdraw(options):
+    service_account, admin_account, user = create_fixtures()
+
+    def run():
+        Transaction.objects.create_withdraw(user=user, to_reference='bench', amount=1000, currency='XLM',
+                                            note='', metadata={})
+    return run
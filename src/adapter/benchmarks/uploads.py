@@ -0,0 +1,42 @@
+import time
+from unittest import mock
+
+from . import StubResponse, benchmark, create_fixtures
+from ..models import Transaction
+from ..rehive_tasks import create_or_confirm_transaction
+
+
+class StubClient:
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000.0
+
+    def create_transaction(self, tx_type, data, token):
+        time.sleep(self.latency)
+        return StubResponse({'data': {'tx_code': 'TX'}}, status_code=201)
+
+    def confirm_transaction(self, tx_code, token):
+        time.sleep(self.latency)
+        return StubResponse({'data': {'tx_code': tx_code}})
+
+
+def upload(options, status: str):
+    service_account, admin_account, user = create_fixtures()
+    txs = [Transaction.objects.create(tx_type='withdraw', user=user, amount=1000, currency='XLM', status=status,
+                                      admin_account=admin_account)
+           for _ in range(options['iterations'] + 10)]
+    stub = mock.patch('adapter.rehive_tasks.get_client', return_value=StubClient(options['latency']))
+
+    def run():
+        with stub:
+            create_or_confirm_transaction(txs.pop().id)
+    return run
+
+
+@benchmark('uploads', 'create_or_confirm_pending', db=True)
+def create_or_confirm_pending(options):
+    return upload(options, 'Pending')
+
+
+@benchmark('uploads', 'create_or_confirm_confirmed', db=True)
+def create_or_confirm_confirmed(options):
+    return upload(options, 'Confirmed')
@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from . import benchmark
+from ..utils import from_cents, from_cents_batch, to_cents, to_cents_batch
+
+BATCH = 10000
+
+
+@benchmark('utils', 'to_cents')
+def bench_to_cents(options):
+    amount = Decimal('1234.5678901')
+
+    def run():
+        to_cents(amount, 7)
+    return run
+
+
+@benchmark('utils', 'from_cents')
+def bench_from_cents(options):
+    def run():
+        from_cents(12345678901, 7)
+    return run
+
+
+@benchmark('utils', 'to_cents_scalar_10k')
+def bench_to_cents_scalar(options):
+    amounts = [Decimal(i) / 7 for i in range(BATCH)]
+
+    def run():
+        [to_cents(amount, 7) for amount in amounts]
+    return run
+
+
+@benchmark('utils', 'to_cents_batch_10k')
+def bench_to_cents_batch(options):
+    amounts = [Decimal(i) / 7 for i in range(BATCH)]
+
+    def run():
+        to_cents_batch(amounts, 7)
+    return run
+
+
+@benchmark('utils', 'from_cents_scalar_10k')
+def bench_from_cents_scalar(options):
+    amounts = list(range(BATCH))
+
+    def run():
+        [from_cents(amount, 7) for amount in amounts]
+    return run
+
+
+@benchmark('utils', 'from_cents_batch_10k')
+def bench_from_cents_batch(options):
+    amounts = list(range(BATCH))
+
+    def run():
+        from_cents_batch(amounts, 7)
+    return run
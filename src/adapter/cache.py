@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from logging import getLogger
+
+logger = getLogger('django')
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe in-process cache with per-entry expiry and LRU eviction.
+    Keeps hit/miss counters so cache effectiveness can be inspected at runtime.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value. The ttl defaults to the cache ttl and can only be shortened by the caller.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._data),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
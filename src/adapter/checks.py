@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Cache backends whose entries are only visible to the process that wrote them.
+PER_PROCESS_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_cache_shared() -> bool:
+    return settings.CACHES['default']['BACKEND'] not in PER_PROCESS_CACHE_BACKENDS
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The Rehive circuit breaker and the account balance cache keep their state in the default Django cache, which
+    only coordinates gunicorn and celery workers if it is shared between processes.
+    """
+    if is_cache_shared():
+        return []
+
+    return [Warning('The default cache (%s) is per process, so each worker trips and recovers its own Rehive circuit '
+                    'breaker, and cached account balances are refreshed in every web process instead of by celery.'
+                    % settings.CACHES['default']['BACKEND'],
+                    hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared cache such as memcached or a database '
+                         'table.',
+                    id='adapter.W001')]
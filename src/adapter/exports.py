@@ -0,0 +1,101 @@
+import csv
+import datetime
+import itertools
+import json
+
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import utc
+
+from .models import ArchivedTransaction, Transaction
+from .streaming import stream_values
+
+# Exported columns and the values() lookups they are read from. The metadata JSON is left out.
+EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('created', 'created'),
+    ('updated', 'updated'),
+    ('completed', 'completed'),
+    ('company', 'admin_account__service_account__company'),
+    ('user', 'user__identifier'),
+    ('tx_type', 'tx_type'),
+    ('status', 'status'),
+    ('amount', 'amount'),
+    ('fee', 'fee'),
+    ('currency', 'currency'),
+    ('rehive_code', 'rehive_code'),
+    ('external_id', 'external_id'),
+    ('to_reference', 'to_reference'),
+    ('from_reference', 'from_reference'),
+    ('note', 'note'),
+)
+
+EXPORT_FORMATS = {'csv': 'text/csv; charset=utf-8',
+                  'ndjson': 'application/x-ndjson; charset=utf-8'}
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """
+    Parses an ISO 8601 date or datetime, defaulting to UTC. Raises ValueError if it is invalid.
+    """
+    parsed = parse_datetime(value) or parse_datetime(value + 'T00:00:00')
+    if parsed is None:
+        raise ValueError('Invalid date: %s' % value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=utc)
+
+
+def get_export_queryset(model, company=None, status=None, tx_type=None, since=None, until=None):
+    queryset = model.objects.all()
+
+    if company:
+        queryset = queryset.filter(admin_account__service_account__company=company)
+    if status:
+        queryset = queryset.filter(status=status)
+    if tx_type:
+        queryset = queryset.filter(tx_type=tx_type)
+    if since:
+        queryset = queryset.filter(created__gte=since)
+    if until:
+        queryset = queryset.filter(created__lt=until)
+
+    return queryset.order_by('id').values(*[lookup for _, lookup in EXPORT_FIELDS])
+
+
+def serialize_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, so csv.writer can produce lines for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in EXPORT_FIELDS])
+    for row in rows:
+        yield writer.writerow([serialize_value(row[lookup]) for _, lookup in EXPORT_FIELDS])
+
+
+def export_ndjson(rows):
+    for row in rows:
+        yield json.dumps({name: serialize_value(row[lookup]) for name, lookup in EXPORT_FIELDS}) + '\n'
+
+
+def export_transactions(export_format: str, chunk_size=2000, **filters):
+    """
+    Returns a generator of CSV or NDJSON lines for the archived, then live, transactions matching `filters` (see
+    get_export_queryset). Rows are read through server-side cursors, so memory use does not grow with the number of
+    transactions.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError('Invalid export format: %s' % export_format)
+
+    rows = itertools.chain.from_iterable(stream_values(get_export_queryset(model, **filters), chunk_size=chunk_size)
+                                         for model in (ArchivedTransaction, Transaction))
+    return export_csv(rows) if export_format == 'csv' else export_ndjson(rows)
@@ -0,0 +1,79 @@
+import datetime
+import json
+import platform
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from adapter.benchmarks import DB_SUITES, compare, load_suites, measure
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Runs adapter hot path benchmarks and prints the results as JSON. Suites that need a database run '
+            'against a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help='Suites to run (default: all).')
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--latency', type=float, default=20.0,
+                            help='Simulated Rehive latency in milliseconds for stubbed calls.')
+        parser.add_argument('--output', help='Write results to this file instead of stdout.')
+        parser.add_argument('--compare', help='Print the change in p50 against an earlier results file.')
+
+    def run_suites(self, suites: dict, names: list, options: dict) -> dict:
+        results = {}
+        for suite in names:
+            for name, setup in sorted(suites[suite].items()):
+                self.stderr.write('Running %s.%s' % (suite, name))
+                results['%s.%s' % (suite, name)] = measure(setup(options), iterations=options['iterations'])
+        return results
+
+    def handle(self, *args, **options):
+        suites = load_suites()
+        names = options['suites'] or sorted(suites)
+
+        unknown = set(names) - set(suites)
+        if unknown:
+            raise CommandError('Unknown suites: %s' % ', '.join(sorted(unknown)))
+
+        if DB_SUITES.intersection(names):
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0)
+            try:
+                results = self.run_suites(suites, names, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+        else:
+            results = self.run_suites(suites, names, options)
+
+        output = {'commit': get_commit(),
+                  'python': platform.python_version(),
+                  'created': datetime.datetime.utcnow().isoformat(),
+                  'options': {'iterations': options['iterations'], 'latency': options['latency']},
+                  'results': results}
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(output, f, indent=2, sort_keys=True)
+        else:
+            self.stdout.write(json.dumps(output, indent=2, sort_keys=True))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+            self.stderr.write('%-50s %12s %12s %9s' % ('benchmark (p50 ms)', baseline.get('commit'), output['commit'],
+                                                      'change'))
+            for name, before, after, change in compare(baseline, output):
+                self.stderr.write('%-50s %12.4f %12.4f %+8.1f%%' % (name, before, after, change))
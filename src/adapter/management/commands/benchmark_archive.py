@@ -0,0 +1,94 @@
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.timezone import utc
+
+from adapter.benchmarks import measure
+from adapter.models import ArchivedTransaction, Transaction, get_archive_sql
+
+from .benchmark_indexes import seed
+
+TABLE = 'adapter_benchmark_transaction'
+ARCHIVE_TABLE = 'adapter_benchmark_archivedtransaction'
+
+INSERT_SQL = """
+    INSERT INTO {table} (id, tx_type, amount, fee, currency, status, created, updated, admin_account_id, user_id)
+    VALUES (%s, 'deposit', 100, 0, 'XLM', 'Waiting', now(), now(), 1, 1)
+"""
+
+
+class Command(BaseCommand):
+    help = ('Seeds scratch copies of the transaction and archive tables (with all their indexes) and measures table '
+            'and index size and single-row insert latency before and after archiving terminal transactions. The '
+            'scratch tables are dropped afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000)
+        parser.add_argument('--after-days', type=int, default=90, help='Archive terminal rows older than this.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--inserts', type=int, default=2000, help='Single-row inserts timed per measurement.')
+        parser.add_argument('--output', help='Write results to this file instead of stdout.')
+
+    def measure_table(self, cursor, inserts: int, next_id: int) -> dict:
+        cursor.execute('SELECT count(*), pg_relation_size(%s::regclass), pg_indexes_size(%s::regclass) '
+                       'FROM {table}'.format(table=TABLE), [TABLE, TABLE])
+        rows, table_bytes, index_bytes = cursor.fetchone()
+
+        ids = iter(range(next_id, next_id + inserts + 10))
+        sql = INSERT_SQL.format(table=TABLE)
+        insert = measure(lambda: cursor.execute(sql, [next(ids)]), iterations=inserts)
+        cursor.execute('DELETE FROM {table} WHERE id >= %s'.format(table=TABLE), [next_id])
+
+        return {'rows': rows, 'table_bytes': table_bytes, 'index_bytes': index_bytes, 'insert': insert}
+
+    def handle(self, *args, **options):
+        results = {'rows': options['rows'], 'after_days': options['after_days']}
+        next_id = options['rows'] + 1
+
+        with connection.cursor() as cursor:
+            for table, like in ((TABLE, Transaction._meta.db_table),
+                                (ARCHIVE_TABLE, ArchivedTransaction._meta.db_table)):
+                cursor.execute('DROP TABLE IF EXISTS {table}'.format(table=table))
+                cursor.execute('CREATE UNLOGGED TABLE {table} (LIKE {like} INCLUDING INDEXES)'
+                               .format(table=table, like=like))
+
+            self.stderr.write('Seeding %s rows...' % options['rows'])
+            seed(cursor, TABLE, options['rows'])
+            cursor.execute('VACUUM ANALYZE {table}'.format(table=TABLE))
+
+            results['before'] = self.measure_table(cursor, options['inserts'], next_id)
+
+            self.stderr.write('Archiving...')
+            before = datetime.datetime.now(tz=utc) - datetime.timedelta(days=options['after_days'])
+            sql = get_archive_sql(TABLE, ARCHIVE_TABLE)
+            archived = 0
+            start = time.perf_counter()
+            while True:
+                cursor.execute(sql, [list(Transaction.TERMINAL_STATUSES), before, options['batch_size']])
+                archived += cursor.rowcount
+                if cursor.rowcount < options['batch_size']:
+                    break
+            elapsed = time.perf_counter() - start
+            results['archive'] = {'rows': archived,
+                                  'seconds': round(elapsed, 3),
+                                  'rows_per_s': round(archived / elapsed, 2) if elapsed else None}
+
+            # Deleted rows leave dead index entries until vacuumed; a one-off REINDEX after the first large archive
+            # run returns the space.
+            cursor.execute('VACUUM ANALYZE {table}'.format(table=TABLE))
+            results['after_vacuum'] = self.measure_table(cursor, options['inserts'], next_id)
+            cursor.execute('REINDEX TABLE {table}'.format(table=TABLE))
+            results['after_reindex'] = self.measure_table(cursor, options['inserts'], next_id)
+
+            for table in (TABLE, ARCHIVE_TABLE):
+                cursor.execute('DROP TABLE {table}'.format(table=table))
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
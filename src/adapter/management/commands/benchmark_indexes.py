@@ -0,0 +1,110 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+TABLE = 'adapter_benchmark_transaction'
+
+INDEXES = [
+    'CREATE INDEX ON {table} (status, updated)',
+    'CREATE INDEX ON {table} (admin_account_id, status, created)',
+    'CREATE INDEX ON {table} (user_id, created)',
+    "CREATE INDEX ON {table} (id) "
+    "WHERE (rehive_code IS NULL AND status IN ('Pending', 'Confirmed', 'Complete')) OR status = 'Confirmed'",
+    "CREATE INDEX ON {table} (updated) WHERE status IN ('Waiting', 'Pending', 'Confirmed')",
+]
+
+QUERIES = {
+    'retry_sweep': "SELECT id FROM {table} WHERE status = 'Pending' AND updated < now() - interval '1 hour' "
+                   "ORDER BY updated LIMIT 100",
+    'upload_claim': "SELECT id FROM {table} "
+                    "WHERE (rehive_code IS NULL AND status IN ('Pending', 'Confirmed', 'Complete')) OR status = 'Confirmed' "
+                    "ORDER BY id LIMIT 100",
+    'account_dashboard': "SELECT count(*), sum(amount) FROM {table} WHERE admin_account_id = 7 "
+                         "AND status = 'Complete' AND created >= now() - interval '1 day'",
+    'user_history': "SELECT id FROM {table} WHERE user_id = 4242 ORDER BY created DESC LIMIT 50",
+}
+
+
+def plan_nodes(plan: dict) -> list:
+    nodes = [plan['Node Type'] + (' on ' + plan['Index Name'] if 'Index Name' in plan else '')]
+    for child in plan.get('Plans', []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def seed(cursor, table: str, rows: int):
+    """
+    Inserts `rows` synthetic transactions: ~97% terminal rows spread over two years, the rest still open.
+    """
+    cursor.execute("""
+        INSERT INTO {table} (id, tx_type, amount, fee, currency, status, rehive_code, created, updated,
+                             admin_account_id, user_id)
+        SELECT i,
+               CASE WHEN random() < 0.5 THEN 'deposit' ELSE 'withdraw' END,
+               (random() * 100000)::bigint, 0, 'XLM',
+               s.status,
+               CASE WHEN s.status = 'Pending' AND random() < 0.5 THEN NULL ELSE 'TX' || i END,
+               now() - (random() * interval '730 days'),
+               now() - (random() * interval '730 days'),
+               1 + (random() * 19)::int,
+               1 + (random() * 99999)::int
+        FROM generate_series(1, %s) AS i,
+        LATERAL (SELECT CASE WHEN r < 0.9 THEN 'Complete' WHEN r < 0.97 THEN 'Failed'
+                             WHEN r < 0.99 THEN 'Pending' ELSE 'Confirmed' END AS status
+                 FROM (SELECT random() + i * 0 AS r) AS x) AS s
+    """.format(table=table), [rows])
+
+
+class Command(BaseCommand):
+    help = ('Seeds a scratch copy of the transaction table and compares query plans and timings of status-driven '
+            'scans before and after adding the composite/partial indexes. The scratch table is dropped afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000000)
+        parser.add_argument('--output', help='Write results to this file instead of stdout.')
+
+    def explain(self, cursor) -> dict:
+        results = {}
+        for name, sql in QUERIES.items():
+            cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql.format(table=TABLE))
+            plan = cursor.fetchone()[0][0]
+            results[name] = {'plan': plan_nodes(plan['Plan']), 'ms': plan['Execution Time']}
+        return results
+
+    def handle(self, *args, **options):
+        results = {'rows': options['rows']}
+
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {table}'.format(table=TABLE))
+            cursor.execute('CREATE UNLOGGED TABLE {table} (LIKE adapter_transaction)'.format(table=TABLE))
+
+            self.stderr.write('Seeding %s rows...' % options['rows'])
+            start = time.perf_counter()
+            seed(cursor, TABLE, options['rows'])
+            cursor.execute('ANALYZE {table}'.format(table=TABLE))
+            results['seed_s'] = round(time.perf_counter() - start, 3)
+
+            results['before'] = self.explain(cursor)
+
+            start = time.perf_counter()
+            for sql in INDEXES:
+                cursor.execute(sql.format(table=TABLE))
+            cursor.execute('ANALYZE {table}'.format(table=TABLE))
+            results['index_build_s'] = round(time.perf_counter() - start, 3)
+
+            cursor.execute("SELECT indexrelid::regclass::text, pg_relation_size(indexrelid) FROM pg_index "
+                           "WHERE indrelid = %s::regclass", [TABLE])
+            results['index_bytes'] = dict(cursor.fetchall())
+
+            results['after'] = self.explain(cursor)
+
+            cursor.execute('DROP TABLE {table}'.format(table=TABLE))
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
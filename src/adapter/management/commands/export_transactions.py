@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from adapter.exports import EXPORT_FORMATS, export_transactions, parse_timestamp
+
+
+class Command(BaseCommand):
+    help = 'Streams transactions as CSV or NDJSON, without their metadata.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--company')
+        parser.add_argument('--status')
+        parser.add_argument('--tx-type')
+        parser.add_argument('--since', help='Created on or after this date, e.g. 2017-01-01.')
+        parser.add_argument('--until', help='Created before this date.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--output', help='Write to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_timestamp(options['since']) if options['since'] else None
+            until = parse_timestamp(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(e)
+
+        lines = export_transactions(options['format'],
+                                    chunk_size=options['chunk_size'],
+                                    company=options['company'],
+                                    status=options['status'],
+                                    tx_type=options['tx_type'],
+                                    since=since,
+                                    until=until)
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
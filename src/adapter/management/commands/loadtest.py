@@ -0,0 +1,120 @@
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from adapter.benchmarks import percentile
+from adapter.management.commands.rehive_standin import COMPANY_PREFIX
+from adapter.models import AdminAccount, ServiceAccount
+
+
+class Command(BaseCommand):
+    help = ('Drives deposit/ and withdraw/ on a running adapter (gunicorn + celery, with REHIVE_API_URL pointing at '
+            'rehive_standin) and reports throughput and p50/p95/p99 latency per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000/api/1/')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--withdraw-ratio', type=float, default=0.5,
+                            help='Fraction of requests that are withdrawals.')
+        parser.add_argument('--wait', action='store_true',
+                            help='For async (202) responses, long-poll the status endpoint and report end-to-end '
+                                 'latency until the transaction is final.')
+        parser.add_argument('--wait-timeout', type=float, default=120,
+                            help='Seconds to wait for a transaction to become final before recording a timeout.')
+        parser.add_argument('--setup', action='store_true',
+                            help='Create the stand-in users\' service and admin accounts in the local database.')
+        parser.add_argument('--output', help='Write results to this file instead of stdout.')
+
+    def setup_accounts(self, users: int):
+        for i in range(users):
+            company = '%s%s' % (COMPANY_PREFIX, i)
+            service_account, created = ServiceAccount.objects.get_or_create(company=company,
+                                                                            defaults={'token': company})
+            AdminAccount.objects.get_or_create(service_account=service_account, name='hot',
+                                               defaults={'type': 'deposit', 'interface': 'stellar',
+                                                         'default': True})
+
+    def handle(self, *args, **options):
+        if options['setup']:
+            self.setup_accounts(options['users'])
+
+        local = threading.local()
+        timings = defaultdict(list)
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def get_session():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            return local.session
+
+        def record(name, elapsed, status):
+            with lock:
+                timings[name].append(elapsed * 1000)
+                statuses['%s %s' % (name, status)] += 1
+
+        def run(i):
+            session = get_session()
+            headers = {'Authorization': 'JWT %s%s' % (COMPANY_PREFIX, random.randrange(options['users']))}
+
+            if random.random() < options['withdraw_ratio']:
+                name, data = 'withdraw', {'amount': 100, 'currency': 'XLM', 'to_reference': 'loadtest'}
+            else:
+                name, data = 'deposit', {'amount': 100, 'currency': 'XLM', 'from_reference': 'loadtest'}
+
+            start = time.perf_counter()
+            try:
+                r = session.post(options['url'] + name + '/', json=data, headers=headers, timeout=60)
+            except requests.exceptions.RequestException as e:
+                return record(name, time.perf_counter() - start, type(e).__name__)
+            record(name, time.perf_counter() - start, r.status_code)
+
+            if options['wait'] and r.status_code == 202:
+                url = '%stransactions/%s/' % (options['url'], r.json()['data']['id'])
+                deadline = start + options['wait_timeout']
+                status = None
+                while status not in ('Complete', 'Failed', 'Cancelled'):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        status = 'timeout'
+                        break
+                    try:
+                        status = session.get(url, params={'wait': min(10, remaining)}, headers=headers,
+                                             timeout=60).json()['data']['status']
+                    except requests.exceptions.RequestException as e:
+                        status = type(e).__name__
+                        break
+                record(name + '_final', time.perf_counter() - start, status)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(run, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        results = {'requests': options['requests'],
+                   'concurrency': options['concurrency'],
+                   'seconds': round(elapsed, 3),
+                   'throughput_rps': round(options['requests'] / elapsed, 2),
+                   'statuses': dict(statuses),
+                   'latency_ms': {}}
+        for name, values in sorted(timings.items()):
+            values.sort()
+            results['latency_ms'][name] = {'count': len(values),
+                                           'p50': round(percentile(values, 50), 3),
+                                           'p95': round(percentile(values, 95), 3),
+                                           'p99': round(percentile(values, 99), 3)}
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,67 @@
+import datetime
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import utc
+
+from adapter.exports import parse_timestamp
+from adapter.models import ServiceAccount
+from adapter.reconciliation import Reconciler
+
+
+class Command(BaseCommand):
+    help = ('Reconciles local Complete transactions with Rehive and writes mismatches as NDJSON. Progress and '
+            'throughput are reported on stderr.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', required=True, help='Start date (inclusive), e.g. 2017-01-01.')
+        parser.add_argument('--until', help='End date (exclusive), defaults to now.')
+        parser.add_argument('--company', help='Only reconcile this company.')
+        parser.add_argument('--window-hours', type=float, default=24)
+        parser.add_argument('--skew-minutes', type=float, default=60,
+                            help='Longest expected delay between local creation and creation on Rehive.')
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--output', help='Write mismatches to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_timestamp(options['since'])
+            until = parse_timestamp(options['until']) if options['until'] else datetime.datetime.now(tz=utc)
+        except ValueError as e:
+            raise CommandError(e)
+
+        service_accounts = ServiceAccount.objects.order_by('company')
+        if options['company']:
+            service_accounts = service_accounts.filter(company=options['company'])
+
+        output = open(options['output'], 'w') if options['output'] else sys.stdout
+        start = time.perf_counter()
+        totals = {}
+
+        try:
+            for service_account in service_accounts:
+                reconciler = Reconciler(service_account, since, until,
+                                        window=datetime.timedelta(hours=options['window_hours']),
+                                        skew=datetime.timedelta(minutes=options['skew_minutes']),
+                                        page_size=options['page_size'],
+                                        concurrency=options['concurrency'],
+                                        chunk_size=options['chunk_size'])
+
+                for mismatch in reconciler.run():
+                    output.write(json.dumps(mismatch) + '\n')
+
+                for key, value in reconciler.stats.items():
+                    totals[key] = totals.get(key, 0) + value
+
+                elapsed = time.perf_counter() - start
+                self.stderr.write('%s done: %s (%.0f local tx/s)' % (service_account.company, reconciler.stats,
+                                                                     totals['local'] / elapsed))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write('Reconciled in %.1fs: %s' % (time.perf_counter() - start, totals))
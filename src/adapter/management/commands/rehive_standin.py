@@ -0,0 +1,93 @@
+import json
+import random
+import socketserver
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.core.management.base import BaseCommand
+
+# User.company is unique, so every stand-in user belongs to its own company: `loadtest-<n>` for token `loadtest-<n>`.
+COMPANY_PREFIX = 'loadtest-'
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RehiveStandInHandler(BaseHTTPRequestHandler):
+    """
+    Implements the Rehive endpoints the adapter calls, with configurable latency and error rate.
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+    def do_POST(self):
+        data = self.read_json()
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        if random.random() < self.error_rate:
+            return self.send_json(503, {'status': 'error', 'message': 'Stand-in error.'})
+
+        if self.path.endswith('auth/jwt/verify/'):
+            token = data.get('token') or ''
+            if not token.startswith(COMPANY_PREFIX):
+                return self.send_json(400, {'status': 'error', 'message': 'Invalid token.'})
+            return self.send_json(200, {'user': {'identifier': token,
+                                                 'company': token,
+                                                 'first_name': 'Load',
+                                                 'last_name': 'Test',
+                                                 'email': token + '@example.com',
+                                                 'mobile_number': None,
+                                                 'profile': None}})
+
+        if self.path.endswith('admins/transactions/deposit/') or self.path.endswith('admins/transactions/withdraw/'):
+            return self.send_json(201, {'status': 'success', 'data': {'tx_code': uuid.uuid4().hex}})
+
+        if self.path.endswith('admins/transactions/update/'):
+            return self.send_json(200, {'status': 'success', 'data': {'tx_code': data.get('tx_code')}})
+
+        self.send_json(404, {'status': 'error', 'message': 'Not found.'})
+
+
+class Command(BaseCommand):
+    help = ('Runs a local stand-in for the Rehive API (JWT verification and admin transaction endpoints) for load '
+            'testing. Point REHIVE_API_URL at it, e.g. http://localhost:8099/api/3/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument('--latency', type=float, default=50.0, help='Mean response latency in milliseconds.')
+        parser.add_argument('--jitter', type=float, default=10.0, help='Latency standard deviation in milliseconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503.')
+
+    def handle(self, *args, **options):
+        handler = type('Handler', (RehiveStandInHandler,), {'latency': options['latency'] / 1000.0,
+                                                            'jitter': options['jitter'] / 1000.0,
+                                                            'error_rate': options['error_rate']})
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        self.stdout.write('Rehive stand-in listening on %s:%s' % (options['host'], options['port']))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,51 @@
+"""
+Prometheus metrics for the adapter's hot paths, served in text format by MetricsView.
+
+Set the `prometheus_multiproc_dir` environment variable (to a directory shared by the gunicorn workers) so that
+metrics from all worker processes are aggregated on scrape.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Histogram, REGISTRY, generate_latest, multiprocess
+
+VIEW_LATENCY = Histogram('adapter_view_seconds', 'Adapter view latency.', ['view', 'method', 'status'])
+DB_QUERIES = Histogram('adapter_view_db_queries', 'Database queries per request.', ['view'],
+                       buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+JWT_VERIFY_LATENCY = Histogram('adapter_jwt_verify_seconds', 'JWT verification latency.', ['source'])
+REHIVE_LATENCY = Histogram('adapter_rehive_request_seconds', 'Rehive API call latency.', ['endpoint', 'outcome'])
+INTERFACE_LATENCY = Histogram('adapter_interface_seconds', 'Third-party interface call latency.',
+                              ['interface', 'method', 'outcome'])
+TASK_DURATION = Histogram('adapter_task_seconds', 'Celery task duration.', ['task', 'state'])
+TASK_QUEUE_LAG = Histogram('adapter_task_queue_lag_seconds', 'Time between publishing and starting a celery task.',
+                           ['task'], buckets=(.1, .5, 1, 5, 15, 30, 60, 300, 900, 3600))
+
+
+@contextmanager
+def timed(histogram: Histogram, record_outcome: bool = False, **labels):
+    """
+    Observes the duration of the block. If `record_outcome` is set, it is also labelled with `outcome`
+    (success/error), which the histogram must declare.
+    """
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        if record_outcome:
+            labels['outcome'] = outcome
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def get_registry():
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render() -> bytes:
+    return generate_latest(get_registry())
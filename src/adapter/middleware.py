@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+
+from .metrics import DB_QUERIES, VIEW_LATENCY
+
+
+class CountingCursorWrapper(CursorWrapper):
+    """
+    Counts the statements executed through the cursor in `counter`, without keeping the SQL log of the debug cursor.
+    """
+
+    def __init__(self, cursor, db, counter: dict):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        self.counter['queries'] += 1
+        return super(CountingCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter['queries'] += 1
+        return super(CountingCursorWrapper, self).executemany(sql, param_list)
+
+
+class CountingCursorDebugWrapper(CountingCursorWrapper, CursorDebugWrapper):
+    pass
+
+
+class MetricsMiddleware:
+    """
+    Records request latency and, if ADAPTER_METRICS_QUERY_COUNT is set, the number of database queries per view.
+    """
+
+    def process_request(self, request):
+        request._metrics_start = time.perf_counter()
+
+        if getattr(settings, 'ADAPTER_METRICS_QUERY_COUNT', False):
+            counter = request._metrics_queries = {'queries': 0}
+            # Instance attributes shadowing the connection's cursor factories until the response.
+            connection.make_cursor = lambda cursor: CountingCursorWrapper(cursor, connection, counter)
+            connection.make_debug_cursor = lambda cursor: CountingCursorDebugWrapper(cursor, connection, counter)
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_metrics_start'):
+            return response
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+
+        VIEW_LATENCY.labels(view=view, method=request.method, status=response.status_code).observe(
+            time.perf_counter() - request._metrics_start)
+
+        if hasattr(request, '_metrics_queries'):
+            DB_QUERIES.labels(view=view).observe(request._metrics_queries['queries'])
+            del connection.make_cursor
+            del connection.make_debug_cursor
+
+        return response
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adapter', '0003_adminaccount_interface'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='transaction',
+            unique_together=set([('user', 'idempotency_key')]),
+        ),
+    ]
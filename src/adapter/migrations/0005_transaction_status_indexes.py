@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adapter', '0004_transaction_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='transaction',
+            index_together=set([('status', 'updated'), ('admin_account', 'status', 'created'), ('user', 'created')]),
+        ),
+        # Transactions waiting to be created or confirmed on Rehive (TransactionManager.claim_for_upload).
+        migrations.RunSQL(
+            "CREATE INDEX adapter_transaction_upload_queue ON adapter_transaction (id) "
+            "WHERE (rehive_code IS NULL AND status IN ('Pending', 'Confirmed')) OR status = 'Confirmed'",
+            "DROP INDEX adapter_transaction_upload_queue",
+        ),
+        # Non-terminal transactions by last update, for retry sweeps.
+        migrations.RunSQL(
+            "CREATE INDEX adapter_transaction_open ON adapter_transaction (updated) "
+            "WHERE status IN ('Waiting', 'Pending', 'Confirmed')",
+            "DROP INDEX adapter_transaction_open",
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adapter', '0005_transaction_status_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('rehive_code', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('external_id', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('tx_type', models.CharField(choices=[('deposit', 'Deposit'), ('withdraw', 'Withdraw')], max_length=50)),
+                ('to_reference', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('from_reference', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('amount', models.BigIntegerField(default=0)),
+                ('fee', models.BigIntegerField(default=0)),
+                ('currency', models.CharField(max_length=12)),
+                ('status', models.CharField(blank=True, choices=[('Waiting', 'Waiting'), ('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Complete', 'Complete'), ('Failed', 'Failed'), ('Cancelled', 'Cancelled')], max_length=24, null=True)),
+                ('note', models.TextField(blank=True, default='', max_length=100, null=True)),
+                ('metadata', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default={}, null=True)),
+                ('rehive_response', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default={}, null=True)),
+                ('created', models.DateTimeField()),
+                ('updated', models.DateTimeField()),
+                ('completed', models.DateTimeField(blank=True, null=True)),
+                ('idempotency_key', models.CharField(blank=True, max_length=100, null=True)),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('archived', models.DateTimeField()),
+                ('admin_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='adapter.AdminAccount')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='adapter.User')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedtransaction',
+            index_together=set([('user', 'idempotency_key'), ('admin_account', 'status', 'created')]),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Existing responses are copied as one record per transaction. Failed calls were stored as {'status': <code>, ...}.
+COPY_SQL = """
+    INSERT INTO adapter_rehiveresponse (transaction_id, status_code, data, created)
+    SELECT id,
+           CASE WHEN jsonb_typeof(rehive_response -> 'status') = 'number' THEN (rehive_response ->> 'status')::int END,
+           rehive_response,
+           updated
+    FROM {table}
+    WHERE rehive_response IS NOT NULL AND rehive_response <> '{{}}'::jsonb
+    ORDER BY id
+"""
+
+# Puts the latest uncompressed response back on each transaction.
+RESTORE_SQL = """
+    UPDATE {table} AS t SET rehive_response = r.data
+    FROM (SELECT DISTINCT ON (transaction_id) transaction_id, data
+          FROM adapter_rehiveresponse
+          WHERE data IS NOT NULL
+          ORDER BY transaction_id, id DESC) AS r
+    WHERE t.id = r.transaction_id
+"""
+
+TABLES = ('adapter_transaction', 'adapter_archivedtransaction')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adapter', '0006_archivedtransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RehiveResponse',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(blank=True, choices=[('create', 'Create'), ('confirm', 'Confirm')], max_length=24, null=True)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('compressed', models.BinaryField(blank=True, null=True)),
+                ('created', models.DateTimeField()),
+                ('transaction', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='rehive_responses', to='adapter.Transaction')),
+            ],
+        ),
+        migrations.RunSQL(
+            [COPY_SQL.format(table=table) for table in TABLES],
+            [RESTORE_SQL.format(table=table) for table in TABLES],
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='rehive_response',
+        ),
+        migrations.RemoveField(
+            model_name='archivedtransaction',
+            name='rehive_response',
+        ),
+    ]
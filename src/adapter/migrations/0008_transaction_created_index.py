@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adapter', '0007_rehiveresponse'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='created',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedtransaction',
+            name='created',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
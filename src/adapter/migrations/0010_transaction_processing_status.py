@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+STATUS_CHOICES = [('Waiting', 'Waiting'), ('Processing', 'Processing'), ('Pending', 'Pending'),
+                  ('Confirmed', 'Confirmed'), ('Complete', 'Complete'), ('Failed', 'Failed'),
+                  ('Cancelled', 'Cancelled')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adapter', '0009_transaction_upload_lease'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='status',
+            field=models.CharField(blank=True, choices=STATUS_CHOICES, max_length=24, null=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedtransaction',
+            name='status',
+            field=models.CharField(blank=True, choices=STATUS_CHOICES, max_length=24, null=True),
+        ),
+        # Transactions executed (Complete) but not yet created on Rehive are uploaded as well.
+        migrations.RunSQL(
+            "DROP INDEX adapter_transaction_upload_queue; "
+            "CREATE INDEX adapter_transaction_upload_queue ON adapter_transaction (id) "
+            "WHERE (rehive_code IS NULL AND status IN ('Pending', 'Confirmed', 'Complete')) OR status = 'Confirmed'",
+            "DROP INDEX adapter_transaction_upload_queue; "
+            "CREATE INDEX adapter_transaction_upload_queue ON adapter_transaction (id) "
+            "WHERE (rehive_code IS NULL AND status IN ('Pending', 'Confirmed')) OR status = 'Confirmed'",
+        ),
+    ]
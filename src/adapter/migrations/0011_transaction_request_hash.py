@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adapter', '0010_transaction_processing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='request_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='request_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
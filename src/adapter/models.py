@@ -1,12 +1,25 @@
 from logging import getLogger
 
 import datetime
+import hashlib
+import json
+import zlib
+from collections import OrderedDict
+from django.conf import settings
 from django.contrib.postgres.fields import JSONField
-from django.db import models
+from django.db import connection, models, transaction
 from django.utils.timezone import utc
 
+from .cache import TTLCache
+from .metrics import INTERFACE_LATENCY, timed
+
 logger = getLogger('django')
 
+# (profile fingerprint, user id) of recently synced users, keyed by identifier. Entries are dropped when the user is
+# saved or deleted in this process (see signals.py), other processes catch up within the ttl.
+user_profile_cache = TTLCache(max_size=getattr(settings, 'REHIVE_USER_SYNC_CACHE_SIZE', 10000),
+                              ttl=getattr(settings, 'REHIVE_USER_SYNC_CACHE_TTL', 300))
+
 
 class ServiceAccount(models.Model):
     company = models.CharField(max_length=100, unique=True, db_index=True)
@@ -25,6 +38,65 @@ class ServiceAccount(models.Model):
         return super(ServiceAccount, self).save(*args, **kwargs)
 
 
+class UserManager(models.Manager):
+    """
+    Manager functions for keeping users in sync with their Rehive profile.
+    """
+    PROFILE_FIELDS = ('first_name', 'last_name', 'email', 'mobile_number', 'company')
+
+    def sync_profile(self, profile: dict):
+        """
+        Creates or updates the user for a Rehive profile and returns it.
+
+        Unchanged profiles (by fingerprint) are built from the profile and the cached user id without touching the
+        database, so their `created` and `updated` aren't loaded. Otherwise a single INSERT ... ON CONFLICT statement
+        inserts the user, updates it only if a field differs, or returns the existing row as is.
+        """
+        identifier = profile['identifier']
+        values = [profile[field] for field in self.PROFILE_FIELDS]
+        fingerprint = hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+        cached = user_profile_cache.get(identifier)
+        if cached is not None and cached[0] == fingerprint:
+            user = self.model(id=cached[1], identifier=identifier, **dict(zip(self.PROFILE_FIELDS, values)))
+        else:
+            user = self._upsert(identifier, values)
+            user_profile_cache.set(identifier, (fingerprint, user.id))
+
+        user.profile = profile.get('profile')
+        return user
+
+    def _upsert(self, identifier, values):
+        table = self.model._meta.db_table
+        fields = ', '.join(self.PROFILE_FIELDS)
+        excluded = ', '.join('EXCLUDED.%s' % field for field in self.PROFILE_FIELDS)
+        current = ', '.join('%s.%s' % (table, field) for field in self.PROFILE_FIELDS)
+        now = datetime.datetime.now(tz=utc)
+
+        sql = """
+            WITH upsert AS (
+                INSERT INTO {table} (identifier, {fields}, created, updated)
+                VALUES (%s, {placeholders}, %s, %s)
+                ON CONFLICT (identifier) DO UPDATE
+                SET ({fields}, updated) = ({excluded}, EXCLUDED.updated)
+                WHERE ({current}) IS DISTINCT FROM ({excluded})
+                RETURNING *
+            )
+            SELECT * FROM upsert
+            UNION ALL
+            SELECT * FROM {table} WHERE identifier = %s AND NOT EXISTS (SELECT 1 FROM upsert)
+        """.format(table=table, fields=fields, excluded=excluded, current=current,
+                   placeholders=', '.join(['%s'] * len(values)))
+
+        rows = list(self.raw(sql, [identifier] + values + [now, now, identifier]))
+        if rows:
+            return rows[0]
+
+        # A concurrent insert of the same identifier and values conflicts without updating, and the fallback SELECT
+        # runs on the statement's snapshot from before that insert committed. A new statement sees the row.
+        return self.get(identifier=identifier)
+
+
 class User(models.Model):
     """
     Model for storing info linking to a Rehive User.
@@ -38,6 +110,8 @@ class User(models.Model):
     created = models.DateTimeField()
     updated = models.DateTimeField()
 
+    objects = UserManager()
+
     def __str__(self):
         return str(self.identifier)
 
@@ -52,62 +126,235 @@ class User(models.Model):
         app_label = 'adapter'
 
 
+# Transaction fields written by a third-party execution.
+EXECUTION_FIELDS = ['status', 'external_id', 'fee', 'completed']
+
+
+def get_archive_sql(source: str, target: str) -> str:
+    """
+    SQL moving terminal rows from the `source` transaction table to the `target` archive table. Takes the terminal
+    statuses, an updated cutoff and a row limit as parameters.
+    """
+    columns = ', '.join(field.column for field in ArchivedTransaction._meta.concrete_fields
+                        if field.name != 'archived')
+    return """
+        WITH moved AS (
+            DELETE FROM {source}
+            WHERE id IN (
+                SELECT id FROM {source}
+                WHERE status = ANY(%s) AND updated < %s
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {columns}
+        )
+        INSERT INTO {target} ({columns}, archived)
+        SELECT {columns}, now() FROM moved
+    """.format(source=source, target=target, columns=columns)
+
+
 class TransactionManager(models.Manager):
     """
     Manager functions for creating transactions.
     """
-    def create_deposit(self, user, from_reference, amount, currency, note, metadata, admin_account=None):
+    def build_deposit(self, user, from_reference, amount, currency, note, metadata, admin_account=None,
+                      idempotency_key=None, request_hash=None):
+        """
+        Returns an unsaved deposit. Raises AdminAccount.DoesNotExist if the admin account can't be resolved.
+        """
+        from .accounts import account_cache
+
+        # Named account for multiple account scenarios, else the default one.
+        account = account_cache.get_admin_account(user.company, name=admin_account, type='deposit')
+
+        return self.model(tx_type='deposit',
+                          user=user,
+                          to_reference=user.identifier,
+                          from_reference=from_reference,
+                          amount=amount,
+                          currency=currency,
+                          note=note,
+                          admin_account=account,
+                          metadata=metadata,
+                          idempotency_key=idempotency_key,
+                          request_hash=request_hash)
+
+    def build_withdraw(self, user, to_reference, amount, currency, note, metadata, admin_account=None,
+                       idempotency_key=None, request_hash=None):
+        """
+        Returns an unsaved withdrawal. Raises AdminAccount.DoesNotExist if the admin account can't be resolved.
+        """
+        from .accounts import account_cache
+
+        # Named account for multiple account scenarios, else the default one.
+        account = account_cache.get_admin_account(user.company, name=admin_account, type='deposit')
+
+        return self.model(tx_type='withdraw',
+                          user=user,
+                          amount=amount,
+                          from_reference=user.identifier,
+                          to_reference=to_reference,
+                          currency=currency,
+                          note=note,
+                          admin_account=account,
+                          metadata=metadata,
+                          idempotency_key=idempotency_key,
+                          request_hash=request_hash)
+
+    def create_deposit(self, user, from_reference, amount, currency, note, metadata, admin_account=None,
+                       idempotency_key=None, request_hash=None):
+        tx = self.build_deposit(user, from_reference, amount, currency, note, metadata, admin_account,
+                                idempotency_key, request_hash)
+        tx.save(force_insert=True, using=self.db)
+        return tx
 
-        service_account = ServiceAccount.objects.get(company=user.company)
-        admin_accounts = service_account.adminaccount_set.all()
+    def create_withdraw(self, user, to_reference, amount, currency, note, metadata, admin_account=None,
+                        idempotency_key=None, request_hash=None):
+        tx = self.build_withdraw(user, to_reference, amount, currency, note, metadata, admin_account,
+                                 idempotency_key, request_hash)
+        tx.save(force_insert=True, using=self.db)
+        return tx
 
-        if not admin_account:
-            account = admin_accounts.get(type='deposit', default='True')
-        else:
-            account = admin_accounts.get(name=admin_account)  # for multiple account scenarios.
-
-        tx = self.create(tx_type='deposit',
-                         user=user,
-                         to_reference=user.identifier,
-                         from_reference=from_reference,
-                         amount=amount,
-                         currency=currency,
-                         note=note,
-                         admin_account=account,
-                         metadata=metadata)
+    def bulk_create_with_ids(self, objs: list) -> list:
+        """
+        Inserts many transactions with a single bulk_create. Ids are reserved from the table's sequence up front
+        so the created transactions can be referenced (and uploaded) afterwards.
+        """
+        if not objs:
+            return objs
 
-        return tx
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                           [self.model._meta.db_table, len(objs)])
+            ids = [row[0] for row in cursor.fetchall()]
 
-    def create_withdraw(self, user, to_reference, amount, currency, note, metadata, admin_account=None):
+        now = datetime.datetime.now(tz=utc)
+        for obj, id in zip(objs, ids):
+            obj.id = id
+            obj.created = now
+            obj.updated = now
 
-        service_account = ServiceAccount.objects.get(company=user.company)
-        admin_accounts = service_account.adminaccount_set.all()
+        self.bulk_create(objs)
+        return objs
 
-        if not admin_account:
-            account = admin_accounts.get(type='deposit', default='True')
-        else:
-            account = admin_accounts.get(name=admin_account)  # for multiple account scenarios.
-
-        tx = self.create(tx_type='withdraw',
-                         user=user,
-                         amount=amount,
-                         from_reference=user.identifier,
-                         to_reference=to_reference,
-                         currency=currency,
-                         note=note,
-                         admin_account=account,
-                         metadata=metadata)
+    def for_upload(self):
+        """
+        Transactions with everything an upload to Rehive needs loaded in one joined query. Columns the upload only
+        writes or never reads are deferred, so saves must pass update_fields.
+        """
+        return self.select_related('admin_account__service_account').defer('admin_account__secret',
+                                                                            'admin_account__metadata')
 
-        return tx
+    def claim_for_upload(self, limit: int, ids: list = None) -> list:
+        """
+        Claims and returns up to `limit` transactions waiting to be created or confirmed on Rehive, optionally only
+        among `ids`: Confirmed ones, and Pending or Complete (executed by an interface) ones without a Rehive code.
 
+        A claim is a lease (ADAPTER_UPLOAD_LEASE seconds) taken in its own short database transaction, so no row
+        locks are held while Rehive is called. Rows leased or locked by another worker are skipped, leases of crashed
+        workers expire. Whoever claims must release the lease when writing the results (see rehive_tasks.save_uploads).
+        """
+        table = self.model._meta.db_table
+        params = [getattr(settings, 'ADAPTER_UPLOAD_LEASE', 300)]
+        id_filter = ''
+        if ids is not None:
+            id_filter = 'AND id = ANY(%s)'
+            params.append(list(ids))
+        params.append(limit)
+
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE {table} SET upload_lease = now() + %s * interval '1 second'
+                WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE ((rehive_code IS NULL AND status IN ('Pending', 'Confirmed', 'Complete'))
+                           OR status = 'Confirmed')
+                    AND (upload_lease IS NULL OR upload_lease < now()) {id_filter}
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id
+                """.format(table=table, id_filter=id_filter), params)
+            claimed = [row[0] for row in cursor.fetchall()]
+
+        return list(self.for_upload().filter(id__in=claimed).order_by('id'))
+
+    def claim_for_execution(self, ids: list) -> list:
+        """
+        Marks the transactions among `ids` that haven't been executed yet (no status or Waiting) as Processing and
+        returns them, skipping rows locked by another worker, so a redelivered batch doesn't execute them again.
+        """
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE {table} SET status = 'Processing', updated = now()
+                WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE id = ANY(%s) AND (status IS NULL OR status = 'Waiting')
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id
+                """.format(table=self.model._meta.db_table), [list(ids)])
+            claimed = [row[0] for row in cursor.fetchall()]
+
+        return list(self.filter(id__in=claimed).select_related('admin_account__service_account').order_by('id'))
+
+    def archive(self, before: datetime.datetime, limit: int) -> int:
+        """
+        Moves up to `limit` terminal transactions last updated before `before` into the archive table in one
+        statement, skipping rows locked by another worker. Returns the number of transactions moved.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(get_archive_sql(self.model._meta.db_table, ArchivedTransaction._meta.db_table),
+                           [list(self.model.TERMINAL_STATUSES), before, limit])
+            return cursor.rowcount
 
-class Transaction(models.Model):
+    def bulk_update_fields(self, objs: list, fields: list):
+        """
+        Writes the given fields (and `updated`) of many transactions in a single UPDATE ... FROM (VALUES ...).
+        """
+        if not objs:
+            return
+
+        now = datetime.datetime.now(tz=utc)
+        for obj in objs:
+            obj.updated = now
+
+        names = [name for name in OrderedDict.fromkeys(fields) if name != 'updated'] + ['updated']
+        model_fields = [self.model._meta.get_field(name) for name in names]
+        columns = ', '.join(field.column for field in model_fields)
+        placeholder = '(%s, {})'.format(', '.join('%s::{}'.format(field.db_type(connection))
+                                                 for field in model_fields))
+        params = []
+        for obj in objs:
+            params.append(obj.pk)
+            params.extend(field.get_db_prep_save(getattr(obj, field.attname), connection)
+                          for field in model_fields)
+
+        sql = """
+            UPDATE {table} AS t SET {assignments}
+            FROM (VALUES {values}) AS v(id, {columns})
+            WHERE t.id = v.id
+        """.format(table=self.model._meta.db_table,
+                   assignments=', '.join('%s = v.%s' % (field.column, field.column) for field in model_fields),
+                   values=', '.join([placeholder] * len(objs)),
+                   columns=columns)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class AbstractTransaction(models.Model):
     """
-    Third-party transaction model. Includes methods for creating/ confirming on  Rehive and for executing with the
-    third-party.
+    Fields shared by live and archived transactions.
     """
     STATUS = (
         ('Waiting', 'Waiting'),
+        ('Processing', 'Processing'),  # Being executed with the third-party
         ('Pending', 'Pending'),
         ('Confirmed', 'Confirmed'),  # Confirmed but not yet uploaded to rehive
         ('Complete', 'Complete'),  # Confirmed and uploaded to rehive
@@ -118,6 +365,9 @@ class Transaction(models.Model):
         ('deposit', 'Deposit'),
         ('withdraw', 'Withdraw'),
     )
+    # Statuses a transaction never leaves.
+    TERMINAL_STATUSES = ('Complete', 'Failed', 'Cancelled')
+
     user = models.ForeignKey('adapter.User', null=True, blank=True)
     rehive_code = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     external_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)
@@ -130,14 +380,36 @@ class Transaction(models.Model):
     status = models.CharField(max_length=24, choices=STATUS, null=True, blank=True)
     note = models.TextField(max_length=100, null=True, blank=True, default='')
     metadata = JSONField(null=True, blank=True, default={})
-    rehive_response = JSONField(null=True, blank=True, default={})
     admin_account = models.ForeignKey('adapter.AdminAccount')
-    created = models.DateTimeField()
+    created = models.DateTimeField(db_index=True)
     updated = models.DateTimeField()
     completed = models.DateTimeField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)  # Client supplied, unique per user
+    request_hash = models.CharField(max_length=64, null=True, blank=True)  # Of the request with idempotency_key
+
+    class Meta:
+        abstract = True
+
+
+class Transaction(AbstractTransaction):
+    """
+    Third-party transaction model. Includes methods for creating/ confirming on  Rehive and for executing with the
+    third-party.
+    """
+    upload_lease = models.DateTimeField(null=True, blank=True)  # Set while claimed by an uploader
 
     objects = TransactionManager()
 
+    class Meta:
+        unique_together = ('user', 'idempotency_key')
+        # Status/time driven scans (sweeps, reconciliation, dashboards). Partial indexes on non-terminal statuses
+        # are created in migration 0005.
+        index_together = [
+            ('status', 'updated'),
+            ('admin_account', 'status', 'created'),
+            ('user', 'created'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.id:  # On create
             self.created = datetime.datetime.now(tz=utc)
@@ -147,15 +419,17 @@ class Transaction(models.Model):
 
     def upload_to_rehive(self):
         from .rehive_tasks import create_or_confirm_transaction
-        self.refresh_from_db()
         create_or_confirm_transaction(self.id)
 
-    def execute(self):
+    def execute(self, upload=True):
         from .rehive_tasks import create_or_confirm_transaction
-        from .api import INTERFACES
-        interface = INTERFACES[self.admin_account.interface](account=self.admin_account)
-        interface.execute(self)  # Execute transaction with third-party
-        create_or_confirm_transaction(tx_id=self.id)  # upload the transaction to rehive
+        from .api import interfaces
+        interface = interfaces.get(self.admin_account)
+        with timed(INTERFACE_LATENCY, record_outcome=True, interface=self.admin_account.interface, method='execute'):
+            interface.execute(self)  # Execute transaction with third-party
+        self.save(update_fields=EXECUTION_FIELDS + ['updated'])
+        if upload:
+            create_or_confirm_transaction(tx_id=self.id)  # upload the transaction to rehive
         return True
 
     def cancel(self):
@@ -164,6 +438,69 @@ class Transaction(models.Model):
         self.save()
 
 
+class ArchivedTransaction(AbstractTransaction):
+    """
+    Terminal transactions moved out of the live table by TransactionManager.archive, keeping their original ids.
+    Read only: nothing uploads or executes archived transactions.
+    """
+    id = models.IntegerField(primary_key=True)
+    archived = models.DateTimeField()
+
+    class Meta:
+        index_together = [
+            ('user', 'idempotency_key'),
+            ('admin_account', 'status', 'created'),
+        ]
+
+
+class RehiveResponseManager(models.Manager):
+    def build(self, tx, action: str, status_code: int, data):
+        """
+        Returns an unsaved response record, zlib compressed if ADAPTER_COMPRESS_REHIVE_RESPONSES is set.
+        """
+        response = self.model(transaction_id=tx.id,
+                              action=action,
+                              status_code=status_code,
+                              created=datetime.datetime.now(tz=utc))
+
+        if getattr(settings, 'ADAPTER_COMPRESS_REHIVE_RESPONSES', False):
+            response.compressed = zlib.compress(json.dumps(data).encode('utf-8'))
+        else:
+            response.data = data
+
+        return response
+
+
+class RehiveResponse(models.Model):
+    """
+    Append-only log of Rehive's replies to transaction create/confirm calls, kept out of the transaction row.
+    The foreign key is not enforced by the database so responses outlive archiving (archived transactions keep
+    their id).
+    """
+    ACTION = (
+        ('create', 'Create'),
+        ('confirm', 'Confirm'),
+    )
+    transaction = models.ForeignKey('adapter.Transaction', related_name='rehive_responses', db_constraint=False,
+                                    on_delete=models.DO_NOTHING)
+    action = models.CharField(max_length=24, choices=ACTION, null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    data = JSONField(null=True, blank=True)
+    compressed = models.BinaryField(null=True, blank=True)
+    created = models.DateTimeField()
+
+    objects = RehiveResponseManager()
+
+    @property
+    def content(self):
+        """
+        The response data, decompressed if needed.
+        """
+        if self.compressed is not None:
+            return json.loads(zlib.decompress(bytes(self.compressed)).decode('utf-8'))
+        return self.data
+
+
 # HotWallet/ Operational Accounts for sending or receiving on behalf of users.
 # Admin accounts usually have a secret key to authenticate with third-party provider (or XPUB for key generation).
 class AdminAccount(models.Model):
@@ -182,9 +519,10 @@ class AdminAccount(models.Model):
         """
         Returns third party identifier of Admin account. E.g. Bitcoin address.
         """
-        from .api import INTERFACES
-        interface = INTERFACES[self.interface](account=self)
-        return interface.get_account_ref()
+        from .api import interfaces
+        interface = interfaces.get(self)
+        with timed(INTERFACE_LATENCY, record_outcome=True, interface=self.interface, method='get_account_ref'):
+            return interface.get_account_ref()
 
     def get_user_ref(self, user: User) -> str:
         """
@@ -192,11 +530,13 @@ class AdminAccount(models.Model):
         :param user:
         :return:
         """
-        from .api import INTERFACES
-        interface = INTERFACES[self.interface](account=self)
-        return interface.get_user_ref(user=user)
+        from .api import interfaces
+        interface = interfaces.get(self)
+        with timed(INTERFACE_LATENCY, record_outcome=True, interface=self.interface, method='get_user_ref'):
+            return interface.get_user_ref(user=user)
 
     def get_account_balance(self) -> int:
-        from .api import INTERFACES
-        interface = INTERFACES[self.interface](account=self)
-        return interface.get_account_balance()
+        from .api import interfaces
+        interface = interfaces.get(self)
+        with timed(INTERFACE_LATENCY, record_outcome=True, interface=self.interface, method='get_account_balance'):
+            return interface.get_account_balance()
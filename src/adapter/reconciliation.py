@@ -0,0 +1,136 @@
+import datetime
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+from .api import run_in_thread
+from .exceptions import PlatformRequestFailedError
+from .models import ArchivedTransaction, ServiceAccount, Transaction
+from .rehive_client import get_client
+from .streaming import stream_values
+
+logger = getLogger('django')
+
+
+def to_timestamp(value: datetime.datetime) -> int:
+    # Rehive timestamps are in milliseconds.
+    return int(value.timestamp() * 1000)
+
+
+class Reconciler:
+    """
+    Checks that every local `Complete` transaction of a service account exists on Rehive with the same amount and
+    status.
+
+    Works through the date range in windows. For each window local rows are streamed from a server-side cursor and
+    Rehive's transaction listing for the window (extended by `skew`, since uploads reach Rehive after the local row
+    is created) is paged through concurrently and indexed by tx_code. Memory is bounded by one window of Rehive
+    transactions.
+    """
+
+    def __init__(self, service_account: ServiceAccount, since: datetime.datetime, until: datetime.datetime,
+                 window=datetime.timedelta(days=1), skew=datetime.timedelta(hours=1), page_size=500, concurrency=8,
+                 chunk_size=2000):
+        self.service_account = service_account
+        self.since = since
+        self.until = until
+        self.window = window
+        self.skew = skew
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.client = get_client()
+        self.stats = {'windows': 0, 'local': 0, 'remote': 0, 'matched': 0, 'mismatched': 0}
+
+    def fetch_page(self, start: datetime.datetime, end: datetime.datetime, page: int) -> dict:
+        r = self.client.get('admins/transactions/',
+                            params={'created__gt': to_timestamp(start), 'created__lt': to_timestamp(end),
+                                    'page': page, 'page_size': self.page_size},
+                            token=self.service_account.token,
+                            name='list_transactions')
+        if r.status_code != 200:
+            raise PlatformRequestFailedError('Rehive transaction listing failed: HTTP %s %s' % (r.status_code, r.text))
+        return r.json()['data']
+
+    def fetch_remote(self, start: datetime.datetime, end: datetime.datetime) -> dict:
+        """
+        Returns Rehive transactions created in [start, end) keyed by tx_code.
+        """
+        first = self.fetch_page(start, end, 1)
+        pages = [first]
+
+        page_count = -(-first['count'] // self.page_size)
+        if page_count > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                pages.extend(executor.map(lambda page: run_in_thread(self.fetch_page, start, end, page),
+                                          range(2, page_count + 1)))
+
+        return {tx['tx_code']: tx for page in pages for tx in page['results']}
+
+    def local_rows(self, start: datetime.datetime, end: datetime.datetime):
+        """
+        Streams the window's Complete transactions from the archive and the live table.
+        """
+        querysets = [model.objects.filter(admin_account__service_account=self.service_account,
+                                          status='Complete',
+                                          created__gte=start,
+                                          created__lt=end)
+                     .order_by('created')
+                     .values('id', 'rehive_code', 'tx_type', 'amount', 'currency', 'status', 'created')
+                     for model in (ArchivedTransaction, Transaction)]
+        return itertools.chain.from_iterable(stream_values(queryset, chunk_size=self.chunk_size)
+                                             for queryset in querysets)
+
+    @staticmethod
+    def compare(local: dict, remote: dict):
+        """
+        Returns the mismatch type for a local row and its Rehive transaction (or None), or None if they agree.
+        """
+        if not local['rehive_code']:
+            return 'missing_code'
+        if remote is None:
+            return 'missing_remote'
+        # Rehive stores withdrawals as negative amounts.
+        if abs(int(remote['amount'])) != abs(local['amount']):
+            return 'amount_mismatch'
+        if remote['status'] != local['status']:
+            return 'status_mismatch'
+        return None
+
+    def run(self):
+        """
+        Yields a dict per mismatched transaction.
+        """
+        start = self.since
+        while start < self.until:
+            end = min(start + self.window, self.until)
+            window_start = time.perf_counter()
+
+            remote = self.fetch_remote(start, end + self.skew)
+            self.stats['remote'] += len(remote)
+
+            for row in self.local_rows(start, end):
+                self.stats['local'] += 1
+                remote_tx = remote.get(row['rehive_code'])
+                mismatch = self.compare(row, remote_tx)
+
+                if mismatch is None:
+                    self.stats['matched'] += 1
+                    continue
+
+                self.stats['mismatched'] += 1
+                yield {'company': self.service_account.company,
+                       'type': mismatch,
+                       'id': row['id'],
+                       'rehive_code': row['rehive_code'],
+                       'local': {'amount': row['amount'], 'status': row['status'], 'tx_type': row['tx_type'],
+                                 'created': row['created'].isoformat()},
+                       'remote': None if remote_tx is None else {'amount': remote_tx['amount'],
+                                                                 'status': remote_tx['status']}}
+
+            self.stats['windows'] += 1
+            elapsed = time.perf_counter() - window_start
+            logger.info('Reconciled %s %s - %s in %.1fs: %s' % (self.service_account.company, start.isoformat(),
+                                                                end.isoformat(), elapsed, self.stats))
+            start = end
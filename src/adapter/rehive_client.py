@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from logging import getLogger
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+from requests.packages.urllib3.util.retry import Retry
+
+from .checks import is_cache_shared
+from .metrics import REHIVE_LATENCY
+
+logger = getLogger('django')
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of calling Rehive while the circuit breaker is open.
+    """
+
+
+def is_unsent(error: requests.exceptions.RequestException) -> bool:
+    """
+    Whether a request failed before it could reach Rehive (open circuit, invalid url, or no connection could be
+    made), so it is safe to send again. Read timeouts and connections dropped after sending may have been applied.
+    """
+    if isinstance(error, (CircuitOpenError, requests.exceptions.ConnectTimeout, requests.exceptions.MissingSchema,
+                          requests.exceptions.InvalidURL)):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker with its state in the Django cache, so all processes sharing the cache trip and recover together.
+    With a per process cache (the LocMemCache default) every process trips on its own, which is logged and reported
+    by the adapter.W001 system check.
+
+    `failure_threshold` failures (connection errors, timeouts or 5xx responses) within `window` seconds open the
+    circuit and calls fail fast for `reset_timeout` seconds. After that a single probe call per `reset_timeout` is let
+    through (half-open) until one succeeds and closes the circuit again.
+    """
+
+    def __init__(self, name: str, failure_threshold=20, window=60, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.failures_key = 'adapter:circuit:%s:failures' % name
+        self.open_key = 'adapter:circuit:%s:open_until' % name
+        self.probe_key = 'adapter:circuit:%s:probe' % name
+
+        if not is_cache_shared():
+            logger.warning('Circuit breaker %s keeps its state in a per process cache, set CACHE_BACKEND to share it '
+                           'between workers.' % name)
+
+    def allow(self):
+        """
+        Returns None if the circuit is closed, True if a half-open probe may go through and False if the call must
+        fail fast.
+        """
+        open_until = cache.get(self.open_key)
+        if open_until is None:
+            return None
+        if time.time() < open_until:
+            return False
+        return cache.add(self.probe_key, True, self.reset_timeout)
+
+    def record_success(self, state):
+        if state is not None:
+            cache.delete_many([self.open_key, self.failures_key, self.probe_key])
+            logger.info('Rehive circuit closed.')
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, self.window)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:  # Expired between add and incr.
+            failures = 1
+
+        if failures >= self.failure_threshold:
+            cache.set(self.open_key, time.time() + self.reset_timeout, None)
+            cache.delete_many([self.failures_key, self.probe_key])
+            logger.info('Rehive circuit opened after %s failures.' % failures)
+
+
+class RehiveClient:
+    """
+    HTTP client for all Rehive API calls made by the adapter.
+
+    Keeps a pooled keep-alive session, applies connect/read timeouts to every call and retries requests that
+    failed to connect (never ones that may have reached Rehive, since transaction calls are not idempotent).
+    Calls fail fast with CircuitOpenError while Rehive is unhealthy (see CircuitBreaker).
+    """
+
+    def __init__(self, base_url=None, connect_timeout=None, read_timeout=None, max_retries=None,
+                 retry_backoff=None, pool_size=None):
+        self.base_url = base_url or getattr(settings, 'REHIVE_API_URL')
+        self.timeout = (connect_timeout or getattr(settings, 'REHIVE_CONNECT_TIMEOUT', 3.05),
+                        read_timeout or getattr(settings, 'REHIVE_READ_TIMEOUT', 10))
+        self.breaker = CircuitBreaker('rehive',
+                                      failure_threshold=getattr(settings, 'REHIVE_CIRCUIT_FAILURE_THRESHOLD', 20),
+                                      window=getattr(settings, 'REHIVE_CIRCUIT_WINDOW', 60),
+                                      reset_timeout=getattr(settings, 'REHIVE_CIRCUIT_RESET_TIMEOUT', 30))
+
+        retry = Retry(total=max_retries if max_retries is not None else getattr(settings, 'REHIVE_MAX_RETRIES', 2),
+                      read=0,
+                      redirect=0,
+                      status=0,
+                      backoff_factor=retry_backoff or getattr(settings, 'REHIVE_RETRY_BACKOFF', 0.2))
+        pool_size = pool_size or getattr(settings, 'REHIVE_POOL_SIZE', 10)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method: str, path: str, token: str = None, name: str = None, **kwargs):
+        """
+        Makes a request to the Rehive API. Raises requests exceptions on connection errors and timeouts, non 2xx
+        responses are returned to the caller.
+        """
+        headers = kwargs.pop('headers', {})
+        if token:
+            headers['Authorization'] = 'Token ' + token
+
+        name = name or path
+        state = self.breaker.allow()
+        if state is False:
+            REHIVE_LATENCY.labels(endpoint=name, outcome='circuit_open').observe(0)
+            raise CircuitOpenError('Rehive is unavailable, circuit open.')
+
+        start = time.perf_counter()
+        try:
+            r = self.session.request(method, self.base_url + path, headers=headers, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            REHIVE_LATENCY.labels(endpoint=name, outcome='error').observe(time.perf_counter() - start)
+            self.breaker.record_failure()
+            raise
+
+        elapsed = time.perf_counter() - start
+        REHIVE_LATENCY.labels(endpoint=name, outcome=str(r.status_code)).observe(elapsed)
+        if r.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success(state)
+        logger.debug('Rehive %s %s: HTTP %s in %.1fms' % (method, path, r.status_code, elapsed * 1000))
+        return r
+
+    def post(self, path: str, data: dict, token: str = None, name: str = None):
+        return self.request('POST', path, token=token, name=name, json=data)
+
+    def get(self, path: str, params: dict = None, token: str = None, name: str = None):
+        return self.request('GET', path, token=token, name=name, params=params)
+
+    def verify_token(self, token: str):
+        return self.post('auth/jwt/verify/', {'token': token}, name='verify_token')
+
+    def create_transaction(self, tx_type: str, data: dict, token: str):
+        return self.post('admins/transactions/' + tx_type + '/', data, token=token, name='create_' + tx_type)
+
+    def confirm_transaction(self, tx_code: str, token: str):
+        return self.post('admins/transactions/update/', {'tx_code': tx_code, 'status': 'Confirmed'}, token=token,
+                         name='confirm_transaction')
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> RehiveClient:
+    """
+    Returns the Rehive client for the current process, creating it after a fork so that pooled connections are
+    never shared between gunicorn or celery worker processes.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = RehiveClient()
+                _client_pid = pid
+
+    return _client
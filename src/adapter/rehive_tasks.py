@@ -1,120 +1,278 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from celery import shared_task
 
 import logging
 
 from django.conf import settings
+from django.db import transaction
 
+from .api import run_in_thread
 from .exceptions import PlatformRequestFailedError
-from .models import Transaction
+from .models import RehiveResponse, Transaction
+from .rehive_client import get_client, is_unsent
 
 logger = logging.getLogger('django')
 
+# Transaction fields written by an upload.
+UPLOAD_FIELDS = ['status', 'rehive_code', 'upload_lease', 'updated']
+
 @shared_task
 def default_task():
     logger.info('running default task')
     return 'True'
 
 
+def get_retry_countdown(retries: int) -> float:
+    """
+    Exponential backoff with full jitter, so retries queued during an outage don't all hit Rehive at once on
+    recovery.
+    """
+    base = getattr(settings, 'REHIVE_RETRY_BASE_DELAY', 30)
+    cap = getattr(settings, 'REHIVE_RETRY_MAX_DELAY', 60 * 60)
+    return random.uniform(0, min(cap, base * 2 ** retries))
+
+
+def get_transaction_data(tx: Transaction) -> dict:
+    """
+    Returns the Rehive API data for creating a transaction.
+    """
+    # Basic transaction data for api call:
+    data = {
+        'amount': tx.amount,
+        'currency': tx.currency,
+        'metadata': tx.metadata,
+    }
+
+    # Specific transaction data for api call:
+    if tx.tx_type == 'withdraw':
+        data.update({'from_reference': tx.from_reference})
+    else:
+        data.update({'recipient': tx.to_reference})
+
+    if tx.tx_type == 'send':
+        data.update({'sender': tx.from_reference})
+
+    # Deposit now also has reference field. TODO: cleanup after APIv3
+    if tx.tx_type == 'deposit':
+        data.update({'from_reference': tx.from_reference})
+
+    return data
+
+
+def create_on_rehive(tx: Transaction, client) -> RehiveResponse:
+    """
+    Creates the transaction on Rehive and updates (without saving) its status and code.
+    Returns the unsaved response record. Raises requests exceptions on connection errors.
+    """
+    # Make api call with admin authorization:
+    r = client.create_transaction(tx.tx_type, get_transaction_data(tx), tx.admin_account.service_account.token)
+
+    # If successful, mark transaction as pending (confirmed transactions stay Confirmed until confirmed on Rehive,
+    # ones an interface already completed stay Complete):
+    if r.status_code in (200, 201):
+        try:
+            data = r.json()
+            tx.rehive_code = data['data']['tx_code']
+        except (ValueError, KeyError, TypeError):
+            # Created on Rehive without a code to confirm or match it by: never created again, left for reconciliation.
+            logger.error('Transaction %s created on Rehive without a readable tx_code: %s' % (tx.id, r.text))
+            tx.status = 'Failed'
+            return RehiveResponse.objects.build(tx, 'create', r.status_code, {'status': r.status_code, 'data': r.text})
+
+        if tx.status in ('Confirmed', 'Complete'):
+            pass
+        elif tx.tx_type not in 'Deposit':
+            tx.status = 'Pending'
+        else:
+            tx.status = 'Complete'  # TODO: Currently admin deposits complete immediately
+
+    # Else mark as Failed:
+    else:
+        logger.info('Failed transaction update request: HTTP %s Error: %s' % (r.status_code, r.text))
+        tx.status = 'Failed'
+        data = {'status': r.status_code, 'data': r.text}
+
+    return RehiveResponse.objects.build(tx, 'create', r.status_code, data)
+
+
+def confirm_on_rehive(tx: Transaction, client) -> RehiveResponse:
+    """
+    Confirms the transaction on Rehive and updates (without saving) its status.
+    Returns the unsaved response record. Raises requests exceptions on connection errors.
+    """
+    logger.info('Transaction update request.')
+
+    # Make request with admin authorization:
+    r = client.confirm_transaction(tx.rehive_code, tx.admin_account.service_account.token)
+
+    if r.status_code in (200, 201):
+        try:
+            data = r.json()
+        except ValueError:
+            data = {'status': r.status_code, 'data': r.text}
+        tx.status = 'Complete'
+    else:
+        logger.info('Failed transaction update request: HTTP %s Error: %s' % (r.status_code, r.text))
+        data = {'status': r.status_code, 'data': r.text}
+        tx.status = 'Failed'
+
+    return RehiveResponse.objects.build(tx, 'confirm', r.status_code, data)
+
+
+def record_request_failure(tx: Transaction, error: requests.exceptions.RequestException):
+    """
+    Handles a create/confirm call that raised. Returns None if the request never reached Rehive, so it can be retried.
+    Otherwise Rehive may have applied it: the transaction is marked Failed, which takes it out of the upload queue so
+    it is never sent twice, and the returned (unsaved) response record flags it for reconciliation.
+    """
+    if is_unsent(error):
+        return None
+
+    action = 'confirm' if tx.rehive_code else 'create'
+    logger.error('Transaction %s %s may have reached Rehive (%s: %s), marked Failed for reconciliation.'
+                 % (tx.id, action, type(error).__name__, error))
+    tx.status = 'Failed'
+    return RehiveResponse.objects.build(tx, action, None, {'error': '%s: %s' % (type(error).__name__, error)})
+
+
 @shared_task(bind=True, name='adapter.create_or_confirm_rehive_receive.task', max_retries=24, default_retry_delay=60 * 60)
 def create_or_confirm_transaction(self, tx_id: int):
-    tx = Transaction.objects.get(id=tx_id)
+    # Claim the transaction, so it isn't uploaded concurrently by the batch uploader or a duplicate task:
+    claimed = Transaction.objects.claim_for_upload(1, ids=[tx_id])
+    if not claimed:
+        logger.info('Transaction %s is not waiting for upload or is claimed by another worker.' % tx_id)
+        return
+
+    tx = claimed[0]
+    confirm = tx.status == 'Confirmed'
+    client = get_client()
+
+    try:
+        # If transaction has not yet been created, create it (keeping the claim if it still has to be confirmed):
+        if not tx.rehive_code:
+            response = create_on_rehive(tx, client)
+            confirm = confirm and tx.status != 'Failed'
+            save_uploads([tx], [tx], [response], release=not confirm)
+
+        # After creation, or if tx already exists, confirm it if necessary
+        if confirm:
+            response = confirm_on_rehive(tx, client)
+            save_uploads([tx], [tx], [response])
+
+    # On connection error, release the claim and retry if the request never reached Rehive:
+    except requests.exceptions.RequestException as e:
+        response = record_request_failure(tx, e)
+        if response is not None:
+            save_uploads([tx], [tx], [response])
+            return
+
+        save_uploads([tx], [], [])
+        try:
+            logger.info('Retry transaction update request due to connection error.')
+            self.retry(countdown=get_retry_countdown(self.request.retries), exc=PlatformRequestFailedError)
+        except PlatformRequestFailedError:
+            logger.info('Final transaction update request failure due to connection error.')
 
-    if tx.status in ('Failed', 'Completed', 'Cancelled'):
-        raise Exception('Attempting to upload failed, cancelled or already completed transaction.')
 
+def save_uploads(txs: list, uploaded: list, responses: list, fields: list = UPLOAD_FIELDS, release: bool = True):
+    """
+    Writes the results of uploading claimed transactions `txs` in one database transaction: `fields` of the
+    uploaded ones and their responses. If `release`, the upload claim of all of them is cleared as well.
+    """
+    uploaded_ids = {tx.id for tx in uploaded}
+    if release:
+        for tx in txs:
+            tx.upload_lease = None
+
+    with transaction.atomic():
+        Transaction.objects.bulk_update_fields(uploaded, fields)
+        if release:
+            Transaction.objects.bulk_update_fields([tx for tx in txs if tx.id not in uploaded_ids],
+                                                   ['upload_lease'])
+        RehiveResponse.objects.bulk_create(responses)
+
+
+def upload(tx: Transaction, client):
+    """
+    Creates and/or confirms a transaction on Rehive without saving it. Returns the unsaved response records, or None
+    if Rehive could not be reached at all (or the upload raised before sending), in which case the transaction is
+    left as it was. Calls that may have reached Rehive are never repeated (see record_request_failure).
+
+    If the create succeeds but the confirm can't reach Rehive, the create response is returned and the transaction
+    keeps its new code and Confirmed status, so it must be saved to be confirmed (not created again) later.
+    """
     initial_status = tx.status
+    responses = []
 
-    # If transaction has not yet been created, create it:
-    if not tx.rehive_code:
+    try:
+        if not tx.rehive_code:
+            responses.append(create_on_rehive(tx, client))
 
-        # URL, depending on transaction type.
-        url = getattr(settings, 'REHIVE_API_URL') + 'admins/transactions/' + tx.tx_type + '/'
+        if initial_status == 'Confirmed' and tx.status != 'Failed':
+            responses.append(confirm_on_rehive(tx, client))
 
-        # Admin authorization:
-        headers = {'Authorization': 'Token ' + tx.admin_account.service_account.token}
+    except requests.exceptions.RequestException as e:
+        response = record_request_failure(tx, e)
+        if response is not None:
+            return responses + [response]
 
-        try:
-            # Basic transaction data for api call:
-            data = {
-                'amount': tx.amount,
-                'currency': tx.currency,
-                'metadata': tx.metadata,
-            }
-
-            # Specific transaction data for api call:
-            if tx.tx_type == 'withdraw':
-                data.update({'from_reference': tx.from_reference})
-            else:
-                data.update({'recipient': tx.to_reference})
-
-            if tx.tx_type == 'send':
-                data.update({'sender': tx.from_reference})
-
-            # Deposit now also has reference field. TODO: cleanup after APIv3
-            if tx.tx_type == 'deposit':
-                data.update({'from_reference': tx.from_reference})
-
-            # Make api call:
-            r = requests.post(url,
-                              json=data,
-                              headers=headers)
-
-            # If successful, mark transaction as pending:
-            if r.status_code in (200, 201):
-                tx.rehive_response = r.json()
-                tx.rehive_code = tx.rehive_response['data']['tx_code']
-
-                if tx.tx_type not in 'Deposit':
-                    tx.status = 'Pending'
-                else:
-                    tx.status = 'Complete'  # TODO: Currently admin deposits complete immediately
-                tx.save()
-
-            # Else mark as Failed:
-            else:
-                logger.info(headers)
-                logger.info('Failed transaction update request: HTTP %s Error: %s' % (r.status_code, r.text))
-                tx.status = 'Failed'
-                tx.rehive_response = {'status': r.status_code, 'data': r.text}
-                tx.save()
-
-        # On connection error, retry:
-        except (requests.exceptions.RequestException, requests.exceptions.MissingSchema) as e:
-            try:
-                logger.info('Retry transaction update request due to connection error.')
-                self.retry(countdown=5 * 60, exc=PlatformRequestFailedError)
-            except PlatformRequestFailedError:
-                logger.info('Final transaction update request failure due to connection error.')
-
-    # After creation, or if tx already exists, confirm it if necessary
-    if initial_status == 'Confirmed':
-        logger.info('Transaction update request.')
-
-        # Update URL
-        url = getattr(settings, 'REHIVE_API_URL') + 'admins/transactions/update/'
-
-        # Add Authorization headers
-        headers = {'Authorization': 'Token ' + tx.admin_account.service_account.token}
+        logger.info('Transaction %s upload deferred due to connection error: %s' % (tx.id, e))
+        return responses or None
 
-        try:
-            # Make request
-            r = requests.post(url, json={'tx_code': tx.rehive_code, 'status': 'Confirmed'}, headers=headers)
-
-            if r.status_code in (200, 201):
-                tx.rehive_response = r.json()
-                tx.status = 'Complete'
-                tx.save()
-            else:
-                logger.info(headers)
-                logger.info('Failed transaction update request: HTTP %s Error: %s' % (r.status_code, r.text))
-                tx.rehive_response = {'status': r.status_code, 'data': r.text}
-                tx.status = 'Failed'
-                tx.save()
-
-        except (requests.exceptions.RequestException, requests.exceptions.MissingSchema) as e:
-            try:
-                logger.info('Retry transaction update request due to connection error.')
-                self.retry(countdown=5 * 60, exc=PlatformRequestFailedError)
-            except PlatformRequestFailedError:
-                logger.info('Final transaction update request failure due to connection error.')
+    # Anything else (e.g. an admin account without a service account) only fails this transaction, not the batch:
+    except Exception:
+        logger.exception('Transaction %s upload failed.' % tx.id)
+        return responses or None
+
+    return responses
+
+
+def upload_transactions(txs: list, concurrency: int = None) -> tuple:
+    """
+    Uploads transactions to Rehive concurrently over the shared client, without saving them.
+    Returns the transactions that reached Rehive (including partially uploaded ones, see upload) and their unsaved
+    response records.
+    """
+    concurrency = concurrency or getattr(settings, 'ADAPTER_UPLOAD_CONCURRENCY', 8)
+    client = get_client()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda tx: run_in_thread(upload, tx, client), txs))
+
+    uploaded = [tx for tx, responses in zip(txs, results) if responses is not None]
+    responses = [response for result in results if result for response in result]
+    return uploaded, responses
+
+
+@shared_task(name='adapter.upload_transaction_batch.task')
+def upload_transaction_batch(batch_size: int = None, concurrency: int = None):
+    """
+    Claims a batch of transactions waiting to be created or confirmed on Rehive, uploads them concurrently and
+    writes the results back in a single update. No database transaction is held open while Rehive is called: the
+    claim is a lease (see TransactionManager.claim_for_upload) released when the batch is written. Queues the next
+    batch while there is more work.
+    """
+    batch_size = batch_size or getattr(settings, 'ADAPTER_UPLOAD_BATCH_SIZE', 100)
+    concurrency = concurrency or getattr(settings, 'ADAPTER_UPLOAD_CONCURRENCY', 8)
+    start = time.perf_counter()
+
+    txs = Transaction.objects.claim_for_upload(batch_size)
+    if not txs:
+        return {'claimed': 0, 'uploaded': 0}
+
+    uploaded, responses = upload_transactions(txs, concurrency)
+    save_uploads(txs, uploaded, responses)
+
+    elapsed = time.perf_counter() - start
+    logger.info('Uploaded %s of %s transactions in %.2fs (%.1f tx/s).'
+                % (len(uploaded), len(txs), elapsed, len(uploaded) / elapsed))
+
+    # Keep draining while full batches are claimed and Rehive is reachable.
+    if len(txs) == batch_size and uploaded:
+        upload_transaction_batch.delay(batch_size, concurrency)
+
+    return {'claimed': len(txs), 'uploaded': len(uploaded), 'seconds': round(elapsed, 3)}
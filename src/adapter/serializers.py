@@ -4,6 +4,8 @@ from rest_framework import serializers
 
 from logging import getLogger
 
+from .models import Transaction
+
 logger = getLogger('django')
 
 
@@ -20,3 +22,32 @@ class TransactionSerializer(serializers.Serializer):
     created = serializers.CharField(required=True)
     note = serializers.CharField(required=False)
     metadata = serializers.JSONField(required=False)
+
+
+class TransactionStatusSerializer(serializers.ModelSerializer):
+    tx_code = serializers.CharField(source='rehive_code', read_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = ('id', 'tx_code', 'tx_type', 'status', 'amount', 'fee', 'currency', 'created', 'updated',
+                  'completed')
+
+
+class BulkTransactionSerializer(serializers.Serializer):
+    """
+    A single item of a bulk deposit or withdrawal.
+    """
+    amount = serializers.IntegerField(required=True, min_value=0)
+    currency = serializers.CharField(required=True, max_length=12)
+    from_reference = serializers.CharField(required=False, allow_null=True, max_length=100)
+    to_reference = serializers.CharField(required=False, allow_null=True, max_length=100)
+    note = serializers.CharField(required=False, allow_null=True, allow_blank=True, max_length=100)
+    metadata = serializers.JSONField(required=False)
+    admin_account = serializers.CharField(required=False, allow_null=True, max_length=100)
+
+
+class AdminBulkDepositSerializer(BulkTransactionSerializer):
+    """
+    A single item of an admin bulk deposit, crediting the user with the given Rehive identifier.
+    """
+    user = serializers.CharField(required=True, max_length=200)
@@ -0,0 +1,58 @@
+import time
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .accounts import account_cache
+from .api import interfaces
+from .metrics import TASK_DURATION, TASK_QUEUE_LAG
+from .models import AdminAccount, ServiceAccount, User, user_profile_cache
+
+
+@receiver(post_save, sender=ServiceAccount)
+@receiver(post_delete, sender=ServiceAccount)
+@receiver(post_save, sender=AdminAccount)
+@receiver(post_delete, sender=AdminAccount)
+def invalidate_account_cache(sender, instance, **kwargs):
+    account_cache.invalidate()
+
+
+@receiver(post_save, sender=AdminAccount)
+@receiver(post_delete, sender=AdminAccount)
+def invalidate_interface(sender, instance, **kwargs):
+    interfaces.invalidate(instance.id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_profile(sender, instance, **kwargs):
+    user_profile_cache.invalidate(instance.identifier)
+
+
+# Celery task metrics
+# ---------------------------------------------------------------------------------------------------------------------
+_task_starts = {}
+
+
+@before_task_publish.connect
+def stamp_task_published(headers=None, **kwargs):
+    if headers is not None:
+        headers['adapter_published_at'] = time.time()
+
+
+@task_prerun.connect
+def record_task_started(task_id=None, task=None, **kwargs):
+    _task_starts[task_id] = time.perf_counter()
+
+    published = getattr(task.request, 'adapter_published_at', None) or \
+        (getattr(task.request, 'headers', None) or {}).get('adapter_published_at')
+    if published:
+        TASK_QUEUE_LAG.labels(task=task.name).observe(max(0, time.time() - published))
+
+
+@task_postrun.connect
+def record_task_finished(task_id=None, task=None, state=None, **kwargs):
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        TASK_DURATION.labels(task=task.name, state=state or 'UNKNOWN').observe(time.perf_counter() - start)
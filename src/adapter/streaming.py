@@ -0,0 +1,30 @@
+import uuid
+
+from django.db import connections, transaction
+
+
+def stream_values(queryset, chunk_size: int = 2000):
+    """
+    Yields the rows of a values() queryset as dicts, fetched `chunk_size` at a time through a PostgreSQL server-side
+    (named) cursor, so memory stays constant regardless of the number of rows.
+    """
+    query = queryset.query
+    names = list(query.extra_select) + list(query.values_select) + list(query.annotation_select)
+    sql, params = query.get_compiler(using=queryset.db).as_sql()
+    connection = connections[queryset.db]
+
+    # Named cursors only live inside a transaction.
+    with transaction.atomic(using=queryset.db):
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(name='adapter_stream_%s' % uuid.uuid4().hex)
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(names, row))
+        finally:
+            cursor.close()
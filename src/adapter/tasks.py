@@ -0,0 +1,106 @@
+import datetime
+
+from celery import shared_task
+
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import utc
+
+from .models import EXECUTION_FIELDS, AdminAccount, Transaction
+
+logger = logging.getLogger('django')
+
+
+@shared_task(name='adapter.execute_transaction.task')
+def execute_transaction(tx_id: int):
+    """
+    Executes a transaction with the third-party and uploads it to Rehive, for transactions submitted
+    asynchronously. The transaction is claimed as Processing first, so a redelivered task doesn't execute it again.
+    """
+    claimed = Transaction.objects.claim_for_execution([tx_id])
+    if not claimed:
+        logger.info('Transaction %s was already executed or is claimed by another worker.' % tx_id)
+        return
+
+    tx = claimed[0]
+    logger.info('Executing transaction %s.' % tx_id)
+    tx.execute()
+
+
+@shared_task(name='adapter.process_transaction_batch.task')
+def process_transaction_batch(tx_ids: list):
+    """
+    Executes a batch of new transactions with the third-party concurrently (see api.execute_concurrently), uploads
+    them to Rehive as one concurrent batch and writes all results back in a single update.
+
+    Transactions are claimed as Processing first, so a redelivered batch doesn't execute them again. Ones whose
+    execution raises are logged and left Processing for inspection. Executed transactions that can't reach Rehive
+    are picked up by the periodic batch uploader if their interface left them Pending or Confirmed (see
+    TransactionManager.claim_for_upload); ones it marked Complete are only uploaded here.
+    """
+    from .api import execute_concurrently
+    from .rehive_tasks import save_uploads, upload_transactions
+
+    txs = Transaction.objects.claim_for_execution(tx_ids)
+    if len(txs) < len(tx_ids):
+        logger.info('Skipping %s already executed or claimed transactions.' % (len(tx_ids) - len(txs)))
+
+    executed = []
+    for tx, error in zip(txs, execute_concurrently(txs)):
+        if error is None:
+            executed.append(tx)
+        else:
+            logger.error('Failed to execute transaction %s.' % tx.id, exc_info=error)
+
+    # Execution results are written before uploading, so the upload claim sees them and they are kept even if
+    # Rehive can't be reached.
+    Transaction.objects.bulk_update_fields(executed, EXECUTION_FIELDS)
+
+    claimed = Transaction.objects.claim_for_upload(len(executed), ids=[tx.id for tx in executed]) if executed else []
+    uploaded, responses = upload_transactions(claimed)
+    save_uploads(claimed, uploaded, responses)
+
+    return {'claimed': len(txs), 'executed': len(executed), 'uploaded': len(uploaded), 'total': len(tx_ids)}
+
+
+@shared_task(name='adapter.refresh_account_value.task')
+def refresh_account_value(name: str, account_id: int):
+    """
+    Refreshes a cached third-party value (see balances.py) for an admin account.
+    """
+    from .balances import CACHES
+
+    value_cache = CACHES[name]
+    try:
+        value_cache.refresh(AdminAccount.objects.get(id=account_id))
+    except Exception as e:
+        logger.info('Failed to refresh %s of admin account %s: %s' % (name, account_id, e))
+    finally:
+        value_cache.release(account_id)
+
+
+@shared_task(name='adapter.archive_transactions.task')
+def archive_transactions():
+    """
+    Moves terminal transactions not updated for ADAPTER_ARCHIVE_AFTER_DAYS into the archive table, one batch per
+    database transaction so locks stay short and the live table's indexes and vacuum only cover recent rows.
+    """
+    after_days = getattr(settings, 'ADAPTER_ARCHIVE_AFTER_DAYS', 90)
+    if not after_days:
+        return 0
+
+    before = datetime.datetime.now(tz=utc) - datetime.timedelta(days=after_days)
+    batch_size = getattr(settings, 'ADAPTER_ARCHIVE_BATCH_SIZE', 5000)
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            moved = Transaction.objects.archive(before, batch_size)
+        archived += moved
+        if moved < batch_size:
+            break
+
+    logger.info('Archived %s transactions.' % archived)
+    return archived
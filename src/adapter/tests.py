@@ -1,3 +1,1117 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import requests
+
+from django.conf import settings
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import exceptions
+
+from .admin import EstimatedCountPaginator, LargeTableAdmin, UserAdmin
+from .api import StellarInterface, interfaces
+from .authentication import ExternalJWTAuthentication, invalidate_token, jwt_cache
+from .balances import balance_cache
+from .benchmarks import create_fixtures
+from .cache import TTLCache
+from .checks import check_shared_cache
+from .exports import export_transactions
+from .middleware import MetricsMiddleware
+from .models import (AdminAccount, ArchivedTransaction, RehiveResponse, ServiceAccount, Transaction, TransactionManager,
+                     User, user_profile_cache)
+from .rehive_client import CircuitBreaker, CircuitOpenError, RehiveClient
+from .reconciliation import Reconciler
+from .rehive_tasks import create_or_confirm_transaction, get_retry_countdown, upload_transaction_batch
+from .tasks import execute_transaction, process_transaction_batch, refresh_account_value
+from .utils import from_cents, from_cents_batch, to_cents, to_cents_batch
+from .views import get_request_hash
+
+
+class StubResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+
+class FixturesMixin:
+    """
+    Creates a service account with a default admin account and a user, shared by the database tests.
+    """
+
+    def setUp(self):
+        super(FixturesMixin, self).setUp()
+        self.service_account, self.admin_account, self.user = create_fixtures(company='test', identifier='user')
+
+    def create_transaction(self, **kwargs):
+        kwargs = dict({'tx_type': 'withdraw', 'amount': 100, 'currency': 'XLM'}, **kwargs)
+        return Transaction.objects.create(user=self.user, admin_account=self.admin_account, **kwargs)
+
+    def authenticate(self):
+        """
+        Authenticates API requests as the fixture user.
+        """
+        patcher = mock.patch.object(ExternalJWTAuthentication, 'authenticate', return_value=(self.user, 'token'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def patch_rehive_client(self):
+        """
+        Replaces the Rehive client of the upload tasks with a mock that creates and confirms successfully.
+        """
+        client = mock.Mock()
+        client.create_transaction.return_value = StubResponse(201, {'data': {'tx_code': 'TX1'}})
+        client.confirm_transaction.return_value = StubResponse(200, {'data': {'tx_code': 'TX1'}})
+        patcher = mock.patch('adapter.rehive_tasks.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+
+class UploadQueryCountTest(FixturesMixin, TestCase):
+    def setUp(self):
+        super(UploadQueryCountTest, self).setUp()
+        self.client = self.patch_rehive_client()
+
+    def test_create(self):
+        tx = self.create_transaction(status='Pending')
+
+        # The claim (update and joined select in one savepoint, the transaction outside tests), then the update and
+        # response insert in another.
+        with self.assertNumQueries(8):
+            create_or_confirm_transaction(tx.id)
+
+        tx.refresh_from_db()
+        self.assertEqual(tx.rehive_code, 'TX1')
+        self.assertEqual(tx.status, 'Pending')
+        response = tx.rehive_responses.get()
+        self.assertEqual((response.action, response.status_code), ('create', 201))
+        self.assertEqual(response.content, {'data': {'tx_code': 'TX1'}})
+
+    def test_confirm(self):
+        tx = self.create_transaction(status='Confirmed', rehive_code='TX1')
+
+        with self.assertNumQueries(8):
+            create_or_confirm_transaction(tx.id)
+
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, 'Complete')
+        self.assertIsNone(tx.upload_lease)
+        self.client.create_transaction.assert_not_called()
+
+    def test_skips_claimed(self):
+        lease = timezone.now() + datetime.timedelta(minutes=5)
+        tx = self.create_transaction(status='Pending', upload_lease=lease)
+
+        create_or_confirm_transaction(tx.id)
+        self.assertEqual(upload_transaction_batch()['claimed'], 0)
+
+        tx.refresh_from_db()
+        self.assertIsNone(tx.rehive_code)
+        self.client.create_transaction.assert_not_called()
+
+        # Expired claims (of crashed workers) are taken over.
+        Transaction.objects.filter(id=tx.id).update(upload_lease=timezone.now() - datetime.timedelta(seconds=1))
+        create_or_confirm_transaction(tx.id)
+
+        tx.refresh_from_db()
+        self.assertEqual(tx.rehive_code, 'TX1')
+        self.assertIsNone(tx.upload_lease)
+
+    def test_releases_claim_on_connection_error(self):
+        tx = self.create_transaction(status='Pending')
+        self.client.create_transaction.side_effect = requests.exceptions.ConnectTimeout()
+
+        with mock.patch.object(create_or_confirm_transaction, 'retry') as retry:
+            create_or_confirm_transaction(tx.id)
+
+        retry.assert_called_once_with(countdown=mock.ANY, exc=mock.ANY)
+        tx.refresh_from_db()
+        self.assertIsNone(tx.upload_lease)
+        self.assertIsNone(tx.rehive_code)
+
+    def test_create_and_confirm(self):
+        tx = self.create_transaction(status='Confirmed')
+
+        with self.assertNumQueries(12):
+            create_or_confirm_transaction(tx.id)
+
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, 'Complete')
+        self.assertEqual(tx.rehive_code, 'TX1')
+        self.assertEqual([r.action for r in tx.rehive_responses.order_by('id')], ['create', 'confirm'])
+
+    def test_batch_keeps_code_when_confirm_fails(self):
+        tx = self.create_transaction(status='Confirmed')
+        self.client.confirm_transaction.side_effect = CircuitOpenError()
+
+        self.assertEqual(upload_transaction_batch()['uploaded'], 1)
+
+        tx.refresh_from_db()
+        self.assertEqual((tx.rehive_code, tx.status), ('TX1', 'Confirmed'))
+        self.assertEqual([r.action for r in tx.rehive_responses.all()], ['create'])
+
+        # The next batch only confirms it.
+        self.client.confirm_transaction.side_effect = None
+        upload_transaction_batch()
+
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, 'Complete')
+        self.assertEqual(self.client.create_transaction.call_count, 1)
+
+    def test_batch(self):
+        txs = [self.create_transaction(status='Pending') for _ in range(3)]
+        self.create_transaction(status='Complete', rehive_code='TX0')
+
+        with mock.patch.object(upload_transaction_batch, 'delay') as delay:
+            result = upload_transaction_batch(batch_size=2, concurrency=2)
+
+        # A full batch queues the next one.
+        self.assertEqual((result['claimed'], result['uploaded']), (2, 2))
+        delay.assert_called_once_with(2, 2)
+        uploaded = Transaction.objects.filter(rehive_code='TX1').order_by('id').values_list('id', flat=True)
+        self.assertEqual(list(uploaded), [tx.id for tx in txs[:2]])
+        self.assertEqual(RehiveResponse.objects.filter(action='create').count(), 2)
+        self.assertFalse(Transaction.objects.filter(upload_lease__isnull=False).exists())
+
+        with mock.patch.object(upload_transaction_batch, 'delay') as delay:
+            result = upload_transaction_batch(batch_size=2, concurrency=2)
+
+        self.assertEqual((result['claimed'], result['uploaded']), (1, 1))
+        delay.assert_not_called()
+
+    def test_batch_connection_error(self):
+        tx = self.create_transaction(status='Pending')
+        self.client.create_transaction.side_effect = requests.exceptions.ConnectTimeout()
+
+        with mock.patch.object(upload_transaction_batch, 'delay') as delay:
+            result = upload_transaction_batch(batch_size=1)
+
+        # Nothing reached Rehive, so the batch isn't chained and the claim is released for the next run.
+        self.assertEqual((result['claimed'], result['uploaded']), (1, 0))
+        delay.assert_not_called()
+        tx.refresh_from_db()
+        self.assertEqual((tx.status, tx.rehive_code, tx.upload_lease), ('Pending', None, None))
+        self.assertFalse(RehiveResponse.objects.exists())
+
+    def test_read_timeout_is_not_resent(self):
+        tx = self.create_transaction(status='Pending')
+        self.client.create_transaction.side_effect = requests.exceptions.ReadTimeout()
+
+        with mock.patch.object(create_or_confirm_transaction, 'retry') as retry:
+            create_or_confirm_transaction(tx.id)
+
+        # Rehive may have created it, so it is failed for reconciliation rather than retried.
+        retry.assert_not_called()
+        tx.refresh_from_db()
+        self.assertEqual((tx.status, tx.rehive_code, tx.upload_lease), ('Failed', None, None))
+        response = tx.rehive_responses.get()
+        self.assertEqual((response.action, response.status_code), ('create', None))
+        self.assertEqual(upload_transaction_batch()['claimed'], 0)
+        self.assertEqual(self.client.create_transaction.call_count, 1)
+
+    def test_batch_unreadable_create_is_not_resent(self):
+        tx = self.create_transaction(status='Pending')
+        self.client.create_transaction.return_value = StubResponse(201, {'data': {}})
+
+        self.assertEqual(upload_transaction_batch()['uploaded'], 1)
+
+        tx.refresh_from_db()
+        self.assertEqual((tx.status, tx.rehive_code), ('Failed', None))
+        self.assertEqual(tx.rehive_responses.get().status_code, 201)
+        self.assertEqual(upload_transaction_batch()['claimed'], 0)
+        self.assertEqual(self.client.create_transaction.call_count, 1)
+
+    @override_settings(ADAPTER_COMPRESS_REHIVE_RESPONSES=True)
+    def test_compressed_response(self):
+        tx = self.create_transaction(status='Pending')
+        create_or_confirm_transaction(tx.id)
+
+        response = RehiveResponse.objects.get(transaction_id=tx.id)
+        self.assertIsNone(response.data)
+        self.assertEqual(response.content, {'data': {'tx_code': 'TX1'}})
+
+
+class ProcessTransactionBatchTest(FixturesMixin, TestCase):
+    def setUp(self):
+        super(ProcessTransactionBatchTest, self).setUp()
+        self.rehive = self.patch_rehive_client()
+
+    def test_process(self):
+        txs = [self.create_transaction() for _ in range(2)]
+
+        result = process_transaction_batch([tx.id for tx in txs])
+
+        self.assertEqual(result, {'claimed': 2, 'executed': 2, 'uploaded': 2, 'total': 2})
+        for tx in txs:
+            tx.refresh_from_db()
+            self.assertEqual((tx.status, tx.rehive_code, tx.upload_lease), ('Complete', 'TX1', None))
+
+    def test_redelivery(self):
+        tx = self.create_transaction()
+        process_transaction_batch([tx.id])
+
+        with mock.patch('adapter.api.StellarInterface.execute') as execute:
+            result = process_transaction_batch([tx.id])
+
+        execute.assert_not_called()
+        self.assertEqual((result['claimed'], result['uploaded']), (0, 0))
+        self.assertEqual(self.rehive.create_transaction.call_count, 1)
+
+    def test_execute_transaction_redelivery(self):
+        tx = self.create_transaction()
+        execute_transaction(tx.id)
+
+        with mock.patch('adapter.api.StellarInterface.execute') as execute:
+            execute_transaction(tx.id)
+
+        execute.assert_not_called()
+        tx.refresh_from_db()
+        self.assertEqual((tx.status, tx.rehive_code), ('Complete', 'TX1'))
+        self.assertEqual(self.rehive.create_transaction.call_count, 1)
+
+    def test_execution_error(self):
+        tx = self.create_transaction(status='Waiting')
+
+        with mock.patch('adapter.api.StellarInterface.execute', side_effect=ValueError('Declined')):
+            result = process_transaction_batch([tx.id])
+
+        self.assertEqual((result['claimed'], result['executed']), (1, 0))
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, 'Processing')
+        self.rehive.create_transaction.assert_not_called()
+
+    def test_upload_error(self):
+        ok = self.create_transaction()
+        broken = self.create_transaction(metadata={'broken': True})
+
+        def create_transaction(tx_type, data, token):
+            if data['metadata'].get('broken'):
+                raise KeyError('tx_code')
+            return StubResponse(201, {'data': {'tx_code': 'TX1'}})
+        self.rehive.create_transaction.side_effect = create_transaction
+
+        # Only the broken transaction is left for the periodic uploader.
+        result = process_transaction_batch([ok.id, broken.id])
+
+        self.assertEqual((result['executed'], result['uploaded']), (2, 1))
+        self.assertEqual(Transaction.objects.get(id=ok.id).rehive_code, 'TX1')
+        broken.refresh_from_db()
+        self.assertEqual((broken.status, broken.rehive_code, broken.upload_lease), ('Complete', None, None))
+        self.assertEqual([tx.id for tx in Transaction.objects.claim_for_upload(10)], [broken.id])
+
+
+class BulkTransactionViewTest(FixturesMixin, TestCase):
+    def setUp(self):
+        super(BulkTransactionViewTest, self).setUp()
+        self.authenticate()
+
+    def post(self, name, data):
+        response = self.client.post(reverse('adapter-api:' + name), json.dumps(data),
+                                    content_type='application/json')
+        return response.status_code, json.loads(response.content.decode('utf-8'))
+
+    def test_deposit(self):
+        status_code, body = self.post('bulk_deposit', [{'amount': 100, 'currency': 'XLM', 'from_reference': 'ref'},
+                                                       {'amount': -1, 'currency': 'XLM'},
+                                                       {'amount': 5, 'currency': 'XLM', 'admin_account': 'cold'}])
+
+        self.assertEqual(status_code, 202)
+        self.assertEqual([result['status'] for result in body['data']], ['accepted', 'invalid', 'invalid'])
+        self.assertEqual(body['data'][2]['errors'], {'admin_account': ['Invalid account.']})
+        tx = Transaction.objects.get()
+        self.assertEqual(body['data'][0]['id'], tx.id)
+        self.assertEqual((tx.tx_type, tx.amount, tx.from_reference, tx.to_reference, tx.admin_account_id),
+                         ('deposit', 100, 'ref', 'user', self.admin_account.id))
+
+    @override_settings(REHIVE_ADMIN_TOKEN='admin')
+    def test_admin_deposit(self):
+        other = create_fixtures(company='other', identifier='other')[2]
+        items = [{'amount': 100, 'currency': 'XLM', 'user': 'other'},
+                 {'amount': 100, 'currency': 'XLM', 'user': 'unknown'},
+                 {'amount': 100, 'currency': 'XLM'}]
+
+        self.assertEqual(self.client.post(reverse('adapter-api:admin_bulk_deposit'), json.dumps(items),
+                                          content_type='application/json').status_code, 403)
+        response = self.client.post(reverse('adapter-api:admin_bulk_deposit'), json.dumps(items),
+                                    content_type='application/json', HTTP_AUTHORIZATION='Secret admin')
+
+        # Each item credits its own user, from that user's company's admin account.
+        self.assertEqual(response.status_code, 202)
+        body = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([result['status'] for result in body['data']], ['accepted', 'invalid', 'invalid'])
+        self.assertEqual(body['data'][1]['errors'], {'user': ['Unknown user.']})
+        tx = Transaction.objects.get()
+        self.assertEqual((tx.user_id, tx.to_reference, tx.admin_account.service_account.company),
+                         (other.id, 'other', 'other'))
+
+    def test_withdraw(self):
+        status_code, body = self.post('bulk_withdraw', [{'amount': 100, 'currency': 'XLM', 'to_reference': 'ref'}] * 2)
+
+        self.assertEqual(status_code, 202)
+        self.assertEqual([result['id'] for result in body['data']],
+                         list(Transaction.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(Transaction.objects.filter(tx_type='withdraw', to_reference='ref').count(), 2)
+
+    def test_missing_service_account(self):
+        with mock.patch('adapter.accounts.account_cache.get_admin_account', side_effect=ServiceAccount.DoesNotExist):
+            status_code, body = self.post('bulk_deposit', [{'amount': 100, 'currency': 'XLM'}])
+
+        self.assertEqual(status_code, 400)
+        self.assertEqual(body['data'][0]['status'], 'invalid')
+        self.assertFalse(Transaction.objects.exists())
+
+    @override_settings(ADAPTER_BULK_MAX_ITEMS=1)
+    def test_invalid_request(self):
+        self.assertEqual(self.post('bulk_deposit', {'amount': 100})[0], 400)
+        self.assertEqual(self.post('bulk_deposit', [{'amount': 100, 'currency': 'XLM'}] * 2)[0], 400)
+        self.assertFalse(Transaction.objects.exists())
+
+
+@override_settings(ADAPTER_ASYNC_TRANSACTIONS=False)
+class IdempotencyTest(FixturesMixin, TestCase):
+    data = {'amount': 100, 'currency': 'XLM', 'to_reference': 'ref'}
+
+    def setUp(self):
+        super(IdempotencyTest, self).setUp()
+        self.authenticate()
+        self.rehive = self.patch_rehive_client()
+
+    def post(self, data, name='withdraw', key='key-1'):
+        response = self.client.post(reverse('adapter-api:' + name), json.dumps(data),
+                                    content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+        return response.status_code, json.loads(response.content.decode('utf-8'))
+
+    def test_replay(self):
+        first = self.post(self.data)
+
+        with mock.patch('adapter.api.StellarInterface.execute') as execute:
+            second = self.post(self.data)
+
+        execute.assert_not_called()
+        self.assertEqual(first, (200, {'status': 'success', 'data': {'tx_code': 'TX1'}}))
+        self.assertEqual(second, first)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_key_reused(self):
+        self.post(self.data)
+
+        self.assertEqual(self.post(dict(self.data, amount=200))[0], 400)
+        self.assertEqual(self.post(self.data, name='deposit')[0], 400)
+        self.assertEqual(self.post(self.data, key='key-2')[0], 200)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_race(self):
+        tx = self.create_transaction(to_reference='ref', rehive_code='TX0', idempotency_key='key-1',
+                                     request_hash=get_request_hash('withdraw', self.data))
+
+        # The lookup before the insert misses, as it does while a concurrent request's insert isn't committed.
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            status_code, body = self.post(self.data)
+
+        self.assertEqual((status_code, body['data']['tx_code']), (200, 'TX0'))
+        self.assertEqual(list(Transaction.objects.values_list('id', flat=True)), [tx.id])
+        self.rehive.create_transaction.assert_not_called()
+
+    def test_other_integrity_error(self):
+        with mock.patch.object(TransactionManager, 'create_withdraw', side_effect=IntegrityError('check violation')):
+            with self.assertRaises(IntegrityError):
+                self.post(self.data)
+
+
+class TransactionStatusViewTest(FixturesMixin, TestCase):
+    def setUp(self):
+        super(TransactionStatusViewTest, self).setUp()
+        self.authenticate()
+
+    def get(self, tx, wait):
+        return self.client.get(reverse('adapter-api:transaction_status', kwargs={'tx_id': tx.id}), {'wait': wait})
+
+    def test_final_status(self):
+        tx = self.create_transaction(status='Complete')
+
+        with mock.patch('adapter.views.time.sleep') as sleep:
+            response = self.get(tx, 10)
+
+        sleep.assert_not_called()
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['data']['status'], 'Complete')
+
+    @override_settings(ADAPTER_STATUS_MAX_WAIT=0.2, ADAPTER_STATUS_POLL_INTERVAL=0.05)
+    def test_timeout(self):
+        tx = self.create_transaction(status='Pending')
+
+        # Waits are capped by ADAPTER_STATUS_MAX_WAIT.
+        with mock.patch('adapter.views.time.sleep', wraps=time.sleep) as sleep:
+            response = self.get(tx, 60)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['data']['status'], 'Pending')
+        self.assertTrue(1 <= sleep.call_count <= 5)
+
+    def test_negative_wait(self):
+        tx = self.create_transaction(status='Pending')
+
+        with mock.patch('adapter.views.time.sleep') as sleep:
+            self.assertEqual(self.get(tx, -5).status_code, 200)
+
+        sleep.assert_not_called()
+
+    def test_invalid_wait(self):
+        tx = self.create_transaction(status='Pending')
+
+        for wait in ('nan', 'inf', '-inf', 'soon'):
+            self.assertEqual(self.get(tx, wait).status_code, 400, wait)
+
+
+class MetricsMiddlewareTest(TestCase):
+    @override_settings(ADAPTER_METRICS_QUERY_COUNT=True)
+    def test_query_count(self):
+        middleware = MetricsMiddleware()
+        request = RequestFactory().get('/')
+
+        middleware.process_request(request)
+        User.objects.count()
+        with self.assertNumQueries(1):  # Counted through the debug cursor as well
+            list(User.objects.all())
+        with mock.patch('adapter.middleware.DB_QUERIES') as histogram:
+            middleware.process_response(request, HttpResponse())
+
+        histogram.labels.return_value.observe.assert_called_once_with(2)
+        self.assertNotIn('make_cursor', connections['default'].__dict__)
+        self.assertNotIn('make_debug_cursor', connections['default'].__dict__)
+
+    def test_query_count_disabled(self):
+        request = RequestFactory().get('/')
+        MetricsMiddleware().process_request(request)
+
+        self.assertFalse(hasattr(request, '_metrics_queries'))
+        self.assertNotIn('make_cursor', connections['default'].__dict__)
+
+
+class OperatingAccountTest(FixturesMixin, TestCase):
+    def setUp(self):
+        super(OperatingAccountTest, self).setUp()
+        cache.clear()
+        self.admin_account.metadata = {'account_id': 'GHOT'}
+        self.admin_account.save()
+
+        patcher = mock.patch('adapter.api.requests.get')
+        self.horizon = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.horizon.return_value.json.return_value = {'balances': [
+            {'asset_type': 'credit_alphanum4', 'asset_code': 'USD', 'balance': '5.0000000'},
+            {'asset_type': 'native', 'balance': '12.3456789'},
+        ]}
+
+    def set_balance(self, value, age):
+        cache.set(balance_cache.key(self.admin_account.id), {'value': value, 'fetched': time.time() - age}, None)
+
+    def test_stellar_interface(self):
+        interface = interfaces.get(self.admin_account)
+
+        self.assertEqual(interface.get_account_balance(), {'balance': 123456789, 'currency': 'XLM'})
+        self.assertTrue(self.horizon.call_args[0][0].endswith('/accounts/GHOT'))
+        self.assertEqual(interface.get_account_ref()['reference'], 'GHOT')
+
+        with self.assertRaises(ImproperlyConfigured):
+            StellarInterface(account=AdminAccount(metadata={})).get_account_ref()
+
+    def test_fetch_inline_once(self):
+        first = balance_cache.get(self.admin_account)
+        second = balance_cache.get(self.admin_account)
+
+        self.assertEqual((first['value'], first['stale']), ({'balance': 123456789, 'currency': 'XLM'}, False))
+        self.assertEqual(second['value'], first['value'])
+        self.assertEqual(self.horizon.call_count, 1)
+
+    def test_serve_stale(self):
+        self.set_balance({'balance': 1}, age=60)
+
+        # The stale value is served and a single refresh is queued (the lock holds off the second one).
+        with mock.patch('adapter.balances.is_cache_shared', return_value=True), \
+                mock.patch('adapter.tasks.refresh_account_value.delay') as delay:
+            results = [balance_cache.get(self.admin_account) for _ in range(2)]
+
+        self.assertEqual([(result['value'], result['stale']) for result in results], [({'balance': 1}, True)] * 2)
+        delay.assert_called_once_with('balance', self.admin_account.id)
+        self.horizon.assert_not_called()
+
+    def test_serve_stale_per_process_cache(self):
+        self.set_balance({'balance': 1}, age=60)
+
+        # Celery workers wouldn't share a per process cache, so the serving process refreshes it in a thread.
+        with mock.patch('adapter.balances.threading.Thread') as thread, \
+                mock.patch('adapter.tasks.refresh_account_value.delay') as delay:
+            result = balance_cache.get(self.admin_account)
+
+        self.assertEqual(result['value'], {'balance': 1})
+        delay.assert_not_called()
+        thread.assert_called_once_with(target=mock.ANY, args=('balance', self.admin_account.id), daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+    def test_refresh(self):
+        self.set_balance({'balance': 1}, age=60)
+        with mock.patch('adapter.balances.is_cache_shared', return_value=True), \
+                mock.patch('adapter.tasks.refresh_account_value.delay'):
+            balance_cache.get(self.admin_account)
+
+        refresh_account_value('balance', self.admin_account.id)
+
+        result = balance_cache.get(self.admin_account)
+        self.assertEqual((result['value']['balance'], result['stale']), (123456789, False))
+        self.assertIsNone(cache.get(balance_cache.key(self.admin_account.id) + ':lock'))
+
+    def test_failed_refresh(self):
+        self.set_balance({'balance': 1}, age=60)
+        self.horizon.side_effect = requests.exceptions.ConnectionError()
+
+        refresh_account_value('balance', self.admin_account.id)
+
+        # The last known value is kept and the next request may retry.
+        self.assertEqual(cache.get(balance_cache.key(self.admin_account.id))['value'], {'balance': 1})
+        self.assertIsNone(cache.get(balance_cache.key(self.admin_account.id) + ':lock'))
+
+    @override_settings(REHIVE_ADMIN_TOKEN='admin')
+    def test_endpoints(self):
+        response = self.client.get(reverse('adapter-api:operating_account'), {'company': 'test'},
+                                   HTTP_AUTHORIZATION='Secret admin')
+
+        self.assertEqual(response.status_code, 200)
+        account = json.loads(response.content.decode('utf-8'))['data'][0]
+        self.assertEqual((account['name'], account['reference']['reference']), ('hot', 'GHOT'))
+        self.assertEqual(account['balance']['balance'], {'balance': 123456789, 'currency': 'XLM'})
+
+        response = self.client.get(reverse('adapter-api:operating_balance'), HTTP_AUTHORIZATION='Secret admin')
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['data'][0]['company'], 'test')
+
+    @override_settings(REHIVE_ADMIN_TOKEN='admin')
+    def test_endpoints_account_errors(self):
+        self.horizon.side_effect = requests.exceptions.HTTPError('404 Client Error')
+        AdminAccount.objects.create(name='cold', type='withdraw', interface='stellar',
+                                    service_account=self.service_account, metadata={})
+
+        response = self.client.get(reverse('adapter-api:operating_account'), {'company': 'test'},
+                                   HTTP_AUTHORIZATION='Secret admin')
+
+        # Each failing account is reported on its own instead of failing the list.
+        self.assertEqual(response.status_code, 200)
+        accounts = {account['name']: account for account in json.loads(response.content.decode('utf-8'))['data']}
+        self.assertEqual(accounts['hot']['reference']['reference'], 'GHOT')
+        self.assertEqual(accounts['hot']['balance'], {'balance': None, 'error': '404 Client Error'})
+        self.assertIsNone(accounts['cold']['reference']['reference'])
+        self.assertIn('account_id', accounts['cold']['reference']['error'])
+        self.assertIn('account_id', accounts['cold']['balance']['error'])
+
+        response = self.client.get(reverse('adapter-api:operating_balance'), HTTP_AUTHORIZATION='Secret admin')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([account['balance'] for account in json.loads(response.content.decode('utf-8'))['data']],
+                         [None, None])
+
+
+class SyncProfileTest(TestCase):
+    profile = {'identifier': 'user', 'first_name': 'Jane', 'last_name': 'Doe', 'email': 'jane@example.com',
+               'mobile_number': None, 'company': 'test'}
+
+    def setUp(self):
+        user_profile_cache.clear()
+
+    def test_unchanged_profile(self):
+        user = User.objects.sync_profile(self.profile)
+
+        with self.assertNumQueries(0):
+            cached = User.objects.sync_profile(dict(self.profile, profile={'id': 1}))
+
+        self.assertEqual((cached.id, cached.email, cached.company), (user.id, 'jane@example.com', 'test'))
+        self.assertEqual(cached.profile, {'id': 1})
+
+    def test_changed_profile(self):
+        User.objects.sync_profile(self.profile)
+
+        with self.assertNumQueries(1):
+            user = User.objects.sync_profile(dict(self.profile, email='doe@example.com'))
+
+        self.assertEqual(user.email, 'doe@example.com')
+        self.assertEqual(User.objects.get().email, 'doe@example.com')
+
+    def test_reapplied_after_save(self):
+        user = User.objects.get(id=User.objects.sync_profile(self.profile).id)
+        user.email = 'edited@example.com'  # e.g. in the admin
+        user.save()
+
+        with self.assertNumQueries(1):
+            User.objects.sync_profile(self.profile)
+
+        self.assertEqual(User.objects.get().email, 'jane@example.com')
+
+    def test_concurrent_insert(self):
+        user = User.objects.sync_profile(self.profile)
+        user_profile_cache.clear()
+
+        # The upsert returning nothing, as when a concurrent request inserted the same profile.
+        with mock.patch.object(User.objects, 'raw', return_value=[]):
+            self.assertEqual(User.objects.sync_profile(self.profile).id, user.id)
+
+    def test_invalidated_on_delete(self):
+        User.objects.sync_profile(self.profile)
+        User.objects.all().delete()
+
+        user = User.objects.sync_profile(self.profile)
+        self.assertEqual(User.objects.get().id, user.id)
+
+
+class ClaimForUploadTest(FixturesMixin, TestCase):
+    def test_predicate(self):
+        waiting = [self.create_transaction(status='Pending'),
+                   self.create_transaction(status='Confirmed'),
+                   self.create_transaction(status='Complete'),
+                   self.create_transaction(status='Confirmed', rehive_code='TX1')]
+        for status in ('Waiting', 'Processing', 'Failed', 'Cancelled'):
+            self.create_transaction(status=status)
+        for status in ('Pending', 'Complete'):
+            self.create_transaction(status=status, rehive_code='TX2')
+
+        claimed = Transaction.objects.claim_for_upload(10)
+
+        self.assertEqual([tx.id for tx in claimed], [tx.id for tx in waiting])
+        self.assertTrue(all(tx.upload_lease > timezone.now() for tx in claimed))
+        # Claimed rows are leased until released.
+        self.assertEqual(Transaction.objects.claim_for_upload(10), [])
+
+    def test_limit_and_ids(self):
+        txs = [self.create_transaction(status='Pending') for _ in range(3)]
+
+        self.assertEqual([tx.id for tx in Transaction.objects.claim_for_upload(1, ids=[txs[2].id, txs[1].id])],
+                         [txs[1].id])
+        self.assertEqual([tx.id for tx in Transaction.objects.claim_for_upload(10, ids=[txs[1].id])], [])
+        self.assertEqual([tx.id for tx in Transaction.objects.claim_for_upload(10)], [txs[0].id, txs[2].id])
+
+
+class ClaimForUploadLockTest(FixturesMixin, TransactionTestCase):
+    def test_skips_locked(self):
+        locked = self.create_transaction(status='Pending')
+        free = self.create_transaction(status='Pending')
+
+        # Lock a row from another connection, like a concurrent claim or archive run would.
+        default = connections['default']
+        other = default.__class__(default.settings_dict, alias='other')
+        try:
+            other.set_autocommit(False)
+            with other.cursor() as cursor:
+                cursor.execute('SELECT id FROM adapter_transaction WHERE id = %s FOR UPDATE', [locked.id])
+                self.assertEqual([tx.id for tx in Transaction.objects.claim_for_upload(10)], [free.id])
+        finally:
+            other.rollback()
+            other.close()
+
+        self.assertEqual([tx.id for tx in Transaction.objects.claim_for_upload(10)], [locked.id])
+
+
+class BulkUpdateFieldsTest(FixturesMixin, TestCase):
+    def test_update(self):
+        txs = [self.create_transaction(status='Pending') for _ in range(3)]
+        txs[0].status, txs[0].rehive_code = 'Complete', 'TX1'
+        txs[1].status = 'Failed'
+        txs[1].amount, txs[1].fee = 1, 5  # Not written
+        before = txs[0].updated
+
+        # Duplicate field names are written once.
+        with self.assertNumQueries(1):
+            Transaction.objects.bulk_update_fields(txs[:2], ['status', 'rehive_code', 'status'])
+
+        rows = list(Transaction.objects.order_by('id').values_list('status', 'rehive_code', 'fee', 'amount'))
+        self.assertEqual(rows, [('Complete', 'TX1', 0, 100), ('Failed', None, 0, 100), ('Pending', None, 0, 100)])
+        self.assertGreater(Transaction.objects.get(id=txs[0].id).updated, before)
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            Transaction.objects.bulk_update_fields([], ['status'])
+
+
+class ExportTest(FixturesMixin, TestCase):
+    def setUp(self):
+        super(ExportTest, self).setUp()
+        for status in ('Complete', 'Failed'):
+            self.create_transaction(tx_type='deposit', status=status, metadata={'large': 'payload'})
+
+    def test_csv(self):
+        lines = list(export_transactions('csv', chunk_size=1, company='test'))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('id,created,updated,completed,company,user,'))
+        self.assertNotIn('payload', ''.join(lines))
+
+    def test_ndjson_filters(self):
+        lines = list(export_transactions('ndjson', status='Complete'))
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual((row['company'], row['user'], row['status'], row['amount']), ('test', 'user', 'Complete', 100))
+
+
+class ReconcilerTest(FixturesMixin, TestCase):
+    def setUp(self):
+        super(ReconcilerTest, self).setUp()
+        self.remote = []
+        client = mock.Mock()
+        client.get.side_effect = self.list_transactions
+        patcher = mock.patch('adapter.reconciliation.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = client
+
+    def list_transactions(self, path, params, token, name):
+        start = (params['page'] - 1) * params['page_size']
+        return StubResponse(200, {'data': {'count': len(self.remote),
+                                           'results': self.remote[start:start + params['page_size']]}})
+
+    def reconciler(self, **kwargs):
+        now = timezone.now()
+        return Reconciler(self.service_account, now - datetime.timedelta(hours=1), now + datetime.timedelta(minutes=1),
+                          **kwargs)
+
+    def test_compare(self):
+        local = {'rehive_code': 'TX1', 'amount': 100, 'status': 'Complete'}
+
+        self.assertIsNone(Reconciler.compare(local, {'amount': '-100', 'status': 'Complete'}))
+        self.assertEqual(Reconciler.compare(dict(local, rehive_code=None), None), 'missing_code')
+        self.assertEqual(Reconciler.compare(local, None), 'missing_remote')
+        self.assertEqual(Reconciler.compare(local, {'amount': '99', 'status': 'Complete'}), 'amount_mismatch')
+        self.assertEqual(Reconciler.compare(local, {'amount': '100', 'status': 'Failed'}), 'status_mismatch')
+
+    def test_fetch_remote_pages(self):
+        self.remote = [{'tx_code': 'TX%s' % i, 'amount': '100', 'status': 'Complete'} for i in range(5)]
+        reconciler = self.reconciler(page_size=2)
+
+        remote = reconciler.fetch_remote(reconciler.since, reconciler.until)
+
+        self.assertEqual(sorted(remote), ['TX0', 'TX1', 'TX2', 'TX3', 'TX4'])
+        self.assertEqual(sorted(call[1]['params']['page'] for call in self.client.get.call_args_list), [1, 2, 3])
+        self.assertEqual({call[1]['token'] for call in self.client.get.call_args_list}, {'test-token'})
+
+    def test_run(self):
+        for code in ('TX1', 'TX2', 'TX3', 'TX4', None):
+            self.create_transaction(status='Complete', rehive_code=code)
+        self.create_transaction(status='Pending', rehive_code='TX5')
+        self.remote = [{'tx_code': 'TX1', 'amount': '-100', 'status': 'Complete'},
+                       {'tx_code': 'TX2', 'amount': '-50', 'status': 'Complete'},
+                       {'tx_code': 'TX3', 'amount': '-100', 'status': 'Failed'},
+                       {'tx_code': 'TX5', 'amount': '-100', 'status': 'Pending'},
+                       {'tx_code': 'TX9', 'amount': '-100', 'status': 'Complete'}]
+        reconciler = self.reconciler(page_size=2)
+
+        mismatches = list(reconciler.run())
+
+        # Rows are joined on tx_code. Only local Complete rows are checked, so transactions that exist only on Rehive
+        # (TX9) aren't reported.
+        self.assertEqual(sorted((mismatch['rehive_code'] or '', mismatch['type']) for mismatch in mismatches),
+                         [('', 'missing_code'), ('TX2', 'amount_mismatch'), ('TX3', 'status_mismatch'),
+                          ('TX4', 'missing_remote')])
+        self.assertEqual(next(mismatch for mismatch in mismatches if mismatch['rehive_code'] == 'TX2')['remote'],
+                         {'amount': '-50', 'status': 'Complete'})
+        self.assertEqual(reconciler.stats, {'windows': 1, 'local': 5, 'remote': 5, 'matched': 1, 'mismatched': 4})
+
+
+class ArchiveTest(FixturesMixin, TestCase):
+    def create_old_transaction(self, status, days_ago):
+        tx = self.create_transaction(tx_type='deposit', status=status)
+        Transaction.objects.filter(id=tx.id).update(updated=timezone.now() - datetime.timedelta(days=days_ago))
+        return tx
+
+    def test_archive(self):
+        old = self.create_old_transaction('Complete', 100)
+        self.create_old_transaction('Complete', 1)
+        self.create_old_transaction('Pending', 100)
+
+        self.assertEqual(Transaction.objects.archive(timezone.now() - datetime.timedelta(days=90), 10), 1)
+
+        archived = ArchivedTransaction.objects.get()
+        self.assertEqual((archived.id, archived.status, archived.amount), (old.id, 'Complete', 100))
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(len(list(export_transactions('csv'))), 4)
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    def setUp(self):
+        for i in range(3):
+            User.objects.create(identifier='user%s' % i, company='company%s' % i)
+
+    def test_exact_below_threshold(self):
+        self.assertEqual(EstimatedCountPaginator(User.objects.order_by('id'), 100).count, 3)
+
+    def test_estimate_above_threshold(self):
+        paginator = EstimatedCountPaginator(User.objects.order_by('id'), 100)
+        paginator.estimate_threshold = 0
+        with self.assertNumQueries(1):
+            self.assertIsInstance(paginator.count, int)
+
+    def test_empty_filter(self):
+        self.assertEqual(EstimatedCountPaginator(User.objects.filter(id__in=[]), 100).count, 0)
+
+
+class LargeTableAdminSearchTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(identifier='user%s' % i, company='company%s' % i) for i in range(2)]
+
+    def search(self, model_admin, term):
+        return list(model_admin.get_search_results(None, User.objects.order_by('id'), term)[0])
+
+    def test_search(self):
+        model_admin = UserAdmin(User, site)
+
+        self.assertEqual(self.search(model_admin, ' user1 '), [self.users[1]])
+        self.assertEqual(self.search(model_admin, str(self.users[0].id)), [self.users[0]])
+        self.assertEqual(self.search(model_admin, ''), self.users)
+
+    def test_no_matching_field(self):
+        # A non-numeric term can't match an admin with only numeric search fields.
+        self.assertEqual(self.search(LargeTableAdmin(User, site), 'user1'), [])
+
+
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('test', failure_threshold=2, window=60, reset_timeout=30)
+
+    def test_trip(self):
+        self.assertIsNone(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertIsNone(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertIs(self.breaker.allow(), False)
+
+    def test_half_open_and_recovery(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        # One probe per reset timeout once it has passed.
+        with mock.patch('time.time', return_value=time.time() + 31):
+            state = self.breaker.allow()
+            self.assertIs(state, True)
+            self.assertIs(self.breaker.allow(), False)
+
+        self.breaker.record_success(state)
+        self.assertIsNone(self.breaker.allow())
+
+    def test_success_while_closed(self):
+        self.breaker.record_failure()
+        self.breaker.record_success(None)
+        self.breaker.record_failure()
+
+        # Failures within the window still add up.
+        self.assertIs(self.breaker.allow(), False)
+
+    def test_open_circuit_fails_fast(self):
+        client = RehiveClient(base_url='http://rehive.test/')
+        client.session = mock.Mock()
+        for _ in range(getattr(settings, 'REHIVE_CIRCUIT_FAILURE_THRESHOLD', 20)):
+            client.breaker.record_failure()
+
+        with self.assertRaises(CircuitOpenError):
+            client.confirm_transaction('TX1', 'token')
+        client.session.request.assert_not_called()
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_check_per_process_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['adapter.W001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                           'LOCATION': 'adapter_cache'}})
+    def test_check_shared_cache(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+
+class RetryCountdownTest(SimpleTestCase):
+    @override_settings(REHIVE_RETRY_BASE_DELAY=30, REHIVE_RETRY_MAX_DELAY=100)
+    def test_backoff(self):
+        # The upper bound doubles per retry up to the cap.
+        with mock.patch('adapter.rehive_tasks.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([get_retry_countdown(retries) for retries in range(4)], [30, 60, 100, 100])
+
+        for retries in range(10):
+            self.assertTrue(0 <= get_retry_countdown(retries) <= 100)
+
+
+class Clock:
+    """
+    Stands in for time.monotonic, advanced by hand.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_expiry(self):
+        ttl_cache = TTLCache(max_size=10, ttl=60)
+        ttl_cache.set('a', 1)
+        ttl_cache.set('b', 2, ttl=1000)  # Only ever shortened
+        ttl_cache.set('c', 3, ttl=-1)
+
+        self.clock.now += 59
+        self.assertEqual((ttl_cache.get('a'), ttl_cache.get('b'), ttl_cache.get('c')), (1, 2, None))
+        self.clock.now += 1
+        self.assertEqual((ttl_cache.get('a'), ttl_cache.get('b')), (None, None))
+        self.assertEqual(ttl_cache.stats(), {'size': 0, 'max_size': 10, 'hits': 2, 'misses': 3})
+
+    def test_lru_eviction(self):
+        ttl_cache = TTLCache(max_size=2, ttl=60)
+        ttl_cache.set('a', 1)
+        ttl_cache.set('b', 2)
+        ttl_cache.get('a')
+        ttl_cache.set('c', 3)
+
+        self.assertEqual(len(ttl_cache), 2)
+        self.assertEqual((ttl_cache.get('a'), ttl_cache.get('b'), ttl_cache.get('c')), (1, None, 3))
+
+
+def make_token(exp: float) -> str:
+    """
+    An unsigned JWT with only an `exp` claim, enough for the remote verification path.
+    """
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii').rstrip('=')
+    return '%s.%s.signature' % (encode({'alg': 'HS256', 'typ': 'JWT'}), encode({'exp': int(exp)}))
+
+
+@override_settings(REHIVE_JWT_VERIFICATION='remote')
+class JWTCacheTest(SimpleTestCase):
+    def setUp(self):
+        jwt_cache.clear()
+        self.addCleanup(jwt_cache.clear)
+        self.clock = Clock()
+        patchers = [mock.patch('time.monotonic', self.clock),
+                    mock.patch.object(ExternalJWTAuthentication, 'verify_token_remotely',
+                                      side_effect=lambda token: {'user': {'token': token}})]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.remote = ExternalJWTAuthentication.verify_token_remotely
+
+    def test_hit(self):
+        token = make_token(time.time() + 3600)
+
+        self.assertEqual(ExternalJWTAuthentication.verify_token(token), {'user': {'token': token}})
+        self.clock.now += 299
+        self.assertEqual(ExternalJWTAuthentication.verify_token(token), {'user': {'token': token}})
+        self.assertEqual(self.remote.call_count, 1)
+
+    def test_miss_after_expiry(self):
+        # Cached until the token's own expiry when that is sooner than REHIVE_JWT_CACHE_TTL.
+        token = make_token(time.time() + 30)
+        ExternalJWTAuthentication.verify_token(token)
+
+        self.clock.now += 31
+        ExternalJWTAuthentication.verify_token(token)
+        self.assertEqual(self.remote.call_count, 2)
+
+        # Expired tokens aren't cached at all.
+        expired = make_token(time.time() - 1)
+        ExternalJWTAuthentication.verify_token(expired)
+        ExternalJWTAuthentication.verify_token(expired)
+        self.assertEqual(self.remote.call_count, 4)
+
+    def test_invalidate_token(self):
+        token = make_token(time.time() + 3600)
+        ExternalJWTAuthentication.verify_token(token)
+
+        invalidate_token(token)
+        ExternalJWTAuthentication.verify_token(token)
+        self.assertEqual(self.remote.call_count, 2)
+
+    def test_lru_eviction(self):
+        tokens = [make_token(time.time() + 3600 + i) for i in range(3)]
+
+        with mock.patch('adapter.authentication.jwt_cache', TTLCache(max_size=2, ttl=300)):
+            for token in tokens + tokens[1:]:
+                ExternalJWTAuthentication.verify_token(token)
+            self.assertEqual(self.remote.call_count, 3)
+
+            ExternalJWTAuthentication.verify_token(tokens[0])
+            self.assertEqual(self.remote.call_count, 4)
+
+
+def sign_token(claims: dict, key: str = 'secret', kid: str = None) -> str:
+    token = jwt.encode(claims, key, algorithm='HS256', headers={'kid': kid} if kid else None)
+    return token.decode('ascii') if isinstance(token, bytes) else token
+
+
+@override_settings(REHIVE_JWT_VERIFICATION='local', REHIVE_JWT_KEYS={'default': 'secret', 'other': 'other-secret'},
+                   REHIVE_JWT_ALGORITHMS=['HS256'])
+class LocalJWTVerificationTest(SimpleTestCase):
+    user = {'identifier': 'user', 'company': 'test', 'first_name': 'Jane', 'last_name': 'Doe',
+            'email': 'jane@example.com', 'mobile_number': None, 'profile': None}
+
+    def setUp(self):
+        jwt_cache.clear()
+        self.addCleanup(jwt_cache.clear)
+        patcher = mock.patch.object(ExternalJWTAuthentication, 'verify_token_remotely',
+                                    return_value={'user': {'identifier': 'remote'}})
+        self.remote = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid(self):
+        token = sign_token({'user': self.user, 'exp': int(time.time()) + 3600})
+        self.assertEqual(ExternalJWTAuthentication.verify_token(token), {'user': self.user})
+
+        token = sign_token({'user': self.user, 'exp': int(time.time()) + 3600}, key='other-secret', kid='other')
+        self.assertEqual(ExternalJWTAuthentication.verify_token(token), {'user': self.user})
+        self.remote.assert_not_called()
+
+    def test_invalid(self):
+        # Tokens that fail verification are rejected outright, not passed on to Rehive.
+        for token in (sign_token({'user': self.user, 'exp': int(time.time()) + 3600}, key='wrong'),
+                      sign_token({'user': self.user, 'exp': int(time.time()) - 60}),
+                      'not-a-token'):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                ExternalJWTAuthentication.verify_token(token)
+
+        self.remote.assert_not_called()
+
+    def test_remote_fallback(self):
+        # Tokens signed with a key that isn't configured, or without the full user claims, are verified by Rehive.
+        incomplete = dict(self.user)
+        del incomplete['profile']
+        for token in (sign_token({'user': self.user, 'exp': int(time.time()) + 3600}, key='unknown', kid='unknown'),
+                      sign_token({'user': incomplete, 'exp': int(time.time()) + 3600}),
+                      sign_token({'exp': int(time.time()) + 3600})):
+            self.assertEqual(ExternalJWTAuthentication.verify_token(token), {'user': {'identifier': 'remote'}})
+
+        self.assertEqual(self.remote.call_count, 3)
+
+
+class AmountConversionTest(SimpleTestCase):
+    def test_batch_matches_scalar(self):
+        amounts = [Decimal('0'), Decimal('1.2345678'), Decimal('-3.33333339'), Decimal('99999.9999999')]
+        self.assertEqual(to_cents_batch(amounts, 7), [to_cents(amount, 7) for amount in amounts])
+        cents = [0, 12345678, -5]
+        self.assertEqual(from_cents_batch(cents, 7), [from_cents(amount, 7) for amount in cents])
+
+    def test_floats_use_their_repr(self):
+        self.assertEqual(to_cents_batch([0.29, 1.1], 2), [29, 110])
+
+    def test_overflow(self):
+        with self.assertRaises(OverflowError):
+            to_cents_batch([Decimal(2 ** 63)], 0)
+        with self.assertRaises(OverflowError):
+            from_cents_batch([2 ** 63], 0)
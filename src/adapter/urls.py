@@ -5,10 +5,16 @@ from . import views
 
 urlpatterns = (
     url(r'^withdraw/$', views.WithdrawView.as_view(), name='withdraw'),
+    url(r'^withdraw/bulk/$', views.BulkWithdrawView.as_view(), name='bulk_withdraw'),
     url(r'^deposit/$', views.DepositView.as_view(), name='deposit'),
-    # url(r'^operating/balance/$', views.BalanceView.as_view(), name='operating_balance'),
-    # url(r'^operating/account/$', views.OperatingAccountView.as_view(), name='operating_account'),
+    url(r'^deposit/bulk/$', views.BulkDepositView.as_view(), name='bulk_deposit'),
+    url(r'^deposit/bulk/admin/$', views.AdminBulkDepositView.as_view(), name='admin_bulk_deposit'),
+    url(r'^transactions/export/$', views.TransactionExportView.as_view(), name='transaction_export'),
+    url(r'^transactions/(?P<tx_id>\d+)/$', views.TransactionStatusView.as_view(), name='transaction_status'),
+    url(r'^operating/balance/$', views.BalanceView.as_view(), name='operating_balance'),
+    url(r'^operating/account/$', views.OperatingAccountView.as_view(), name='operating_account'),
     # url(r'^user/account/$', views.UserAccountView.as_view(), name='user_account'),
+    url(r'^metrics/$', views.MetricsView.as_view(), name='metrics'),
     url(r'^$', views.adapter_root)
 
 )
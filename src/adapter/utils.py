@@ -1,6 +1,16 @@
+import functools
 import json
 import urllib.parse
-from decimal import Decimal
+from decimal import Decimal, ROUND_DOWN, localcontext
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Range of the BigIntegerField amounts are stored in.
+BIGINT_MIN = -2 ** 63
+BIGINT_MAX = 2 ** 63 - 1
 
 
 def input_to_json(metadata):
@@ -13,12 +23,66 @@ def input_to_json(metadata):
         return json.loads('{}')
 
 
+@functools.lru_cache(maxsize=None)
+def get_scale(divisibility: int) -> Decimal:
+    return Decimal('10')**Decimal(divisibility)
+
+
 def to_cents(amount: Decimal, divisibility: int) -> int:
-    return int(amount * Decimal('10')**Decimal(divisibility))
+    return int(amount * get_scale(divisibility))
 
 
 def from_cents(amount: int, divisibility: int) -> Decimal:
-    return Decimal(amount) / Decimal('10')**Decimal(divisibility)
+    return Decimal(amount) / get_scale(divisibility)
+
+
+def to_cents_batch(amounts, divisibility: int, rounding=ROUND_DOWN, as_array=False):
+    """
+    Converts a sequence (or NumPy array) of amounts to integer cents with one precomputed scale factor.
+
+    Amounts are multiplied exactly (floats are converted via their shortest repr, so 0.29 is 29 cents, not 28)
+    and rounded with `rounding`, which defaults to truncation like to_cents. Raises OverflowError if a result
+    doesn't fit the BigIntegerField amount columns. Returns a list, or an int64 array if `as_array` is set.
+    """
+    if np is not None and isinstance(amounts, np.ndarray):
+        amounts = amounts.tolist()
+
+    scale = get_scale(divisibility)
+    cents = []
+    with localcontext() as context:
+        context.prec = 80  # Enough for any BigIntegerField value, the product is never rounded.
+
+        for amount in amounts:
+            value = int((Decimal(repr(amount) if isinstance(amount, float) else amount) * scale)
+                        .to_integral_value(rounding=rounding))
+            if not BIGINT_MIN <= value <= BIGINT_MAX:
+                raise OverflowError('Amount %s out of range at divisibility %s.' % (amount, divisibility))
+            cents.append(value)
+
+    if as_array:
+        if np is None:
+            raise ImportError('NumPy is required for as_array.')
+        return np.array(cents, dtype=np.int64)
+
+    return cents
+
+
+def from_cents_batch(amounts, divisibility: int) -> list:
+    """
+    Converts a sequence (or NumPy int64 array) of integer cents to Decimal amounts with one precomputed scale
+    factor. The division is exact.
+    """
+    if np is not None and isinstance(amounts, np.ndarray):
+        amounts = amounts.tolist()
+
+    scale = get_scale(divisibility)
+    results = []
+    for amount in amounts:
+        if not BIGINT_MIN <= amount <= BIGINT_MAX:
+            raise OverflowError('Amount %s out of range.' % amount)
+        results.append(Decimal(amount).scaleb(-divisibility))
+
+    return results
 
 
 def create_qr_code_url(value, size=300):
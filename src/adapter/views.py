@@ -1,22 +1,116 @@
+import hashlib
+import json
+import math
+import time
+from collections import OrderedDict
+
+from celery import group
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
-from rest_framework import exceptions
+from rest_framework import exceptions, status
 from rest_framework.generics import GenericAPIView
 from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 
 from .authentication import ExternalJWTAuthentication
+from .balances import account_ref_cache, balance_cache
+from .exports import EXPORT_FORMATS, export_transactions, parse_timestamp
+from .metrics import render as render_metrics
 from .permissions import UserPermission, AdminPermission
-from .models import AdminAccount, Transaction
+from .models import AdminAccount, ArchivedTransaction, ServiceAccount, Transaction, User
 from logging import getLogger
 
 from .throttling import NoThrottling
 
-from .serializers import TransactionSerializer
+from .serializers import (AdminBulkDepositSerializer, TransactionSerializer, TransactionStatusSerializer,
+                          BulkTransactionSerializer)
+from .tasks import execute_transaction, process_transaction_batch
 
 logger = getLogger('django')
 
 
+def transaction_response(tx: Transaction) -> Response:
+    if getattr(settings, 'ADAPTER_ASYNC_TRANSACTIONS', False):
+        return Response({'status': 'success',
+                         'data': {'id': tx.id, 'tx_code': tx.rehive_code, 'status': tx.status}},
+                        status=status.HTTP_202_ACCEPTED)
+
+    return Response({'status': 'success',
+                     'data': {'tx_code': tx.rehive_code}})
+
+
+def submit_transaction(tx: Transaction) -> Response:
+    """
+    Executes a new transaction and uploads it to Rehive. In async mode both steps are queued and the transaction id
+    is returned immediately so the client can follow it on the status endpoint.
+    """
+    if getattr(settings, 'ADAPTER_ASYNC_TRANSACTIONS', False):
+        execute_transaction.delay(tx.id)
+    else:
+        # Execute transaction using third-party API and upload to Rehive:
+        tx.execute()
+        tx.upload_to_rehive()
+        tx.refresh_from_db()
+
+    return transaction_response(tx)
+
+
+def get_idempotency_key(request):
+    key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+    if key and len(key) > 100:
+        raise exceptions.ValidationError({'idempotency_key': ['Ensure this field has no more than 100 characters.']})
+    return key or None
+
+
+def get_request_hash(tx_type: str, data) -> str:
+    """
+    Fingerprint of a transaction request, stored with its idempotency key to tell retries from reused keys.
+    """
+    body = json.dumps([tx_type, data], sort_keys=True, default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def replay_transaction(tx: Transaction, tx_type: str, request_hash: str) -> Response:
+    # Transactions created before request hashes were stored are only matched on type.
+    if tx.tx_type != tx_type or (tx.request_hash is not None and tx.request_hash != request_hash):
+        raise exceptions.ValidationError({'idempotency_key': ['Key already used for a different transaction.']})
+    return transaction_response(tx)
+
+
+def create_transaction(request, tx_type: str, create) -> Response:
+    """
+    Creates a transaction with `create(idempotency_key=..., request_hash=...)` and submits it. A request repeating
+    an earlier Idempotency-Key header gets the original transaction's result instead of creating and executing a new
+    one, unless the key was used for a different request.
+    """
+    key = get_idempotency_key(request)
+    request_hash = get_request_hash(tx_type, request.data) if key else None
+
+    if key:
+        tx = Transaction.objects.filter(user=request.user, idempotency_key=key).first() or \
+            ArchivedTransaction.objects.filter(user=request.user, idempotency_key=key).first()
+        if tx is not None:
+            return replay_transaction(tx, tx_type, request_hash)
+
+    try:
+        with transaction.atomic():
+            tx = create(idempotency_key=key, request_hash=request_hash)
+    except IntegrityError as error:
+        if not key:
+            raise
+        # Only a collision with a concurrent request using the same key is replayed, other errors are re-raised.
+        try:
+            tx = Transaction.objects.get(user=request.user, idempotency_key=key)
+        except Transaction.DoesNotExist:
+            raise error
+        return replay_transaction(tx, tx_type, request_hash)
+
+    return submit_transaction(tx)
+
+
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
@@ -52,6 +146,12 @@ def adapter_root(request, format=None):
                      'Deposit': reverse('adapter-api:deposit',
                                         request=request,
                                         format=format),
+                     'Operating Balance': reverse('adapter-api:operating_balance',
+                                                  request=request,
+                                                  format=format),
+                     'Operating Account': reverse('adapter-api:operating_account',
+                                                  request=request,
+                                                  format=format),
                      })
 
 
@@ -66,20 +166,14 @@ class WithdrawView(GenericAPIView):
         # Get user model from auth user object:
         user = request.user
 
-        tx = Transaction.objects.create_withdraw(user=user,
-                                                 amount=request.data.get('amount'),
-                                                 currency=request.data.get('currency', ''),
-                                                 to_reference=request.data.get('to_reference'),
-                                                 note=request.data.get('note'),
-                                                 metadata=request.data.get('metadata', {}))
-
-        # Execute transaction using third-party API and upload to Rehive:
-        tx.execute()
-        tx.upload_to_rehive()
-        tx.refresh_from_db()
-
-        return Response({'status': 'success',
-                         'data': {'tx_code': tx.rehive_code}})
+        return create_transaction(request, 'withdraw', lambda **kwargs: Transaction.objects.create_withdraw(
+            user=user,
+            amount=request.data.get('amount'),
+            currency=request.data.get('currency', ''),
+            to_reference=request.data.get('to_reference'),
+            note=request.data.get('note'),
+            metadata=request.data.get('metadata', {}),
+            **kwargs))
 
     def get(self, request, *args, **kwargs):
         raise exceptions.MethodNotAllowed('GET')
@@ -96,26 +190,272 @@ class DepositView(GenericAPIView):
         # Get user model from authentication backend:
         user = request.user
 
-        tx = Transaction.objects.create_deposit(user=user,
-                                                amount=request.data.get('amount'),
-                                                currency=request.data.get('currency'),
-                                                from_reference=request.data.get('from_reference'),
-                                                note=request.data.get('note'),
-                                                metadata=request.data.get('metadata', {}))
+        return create_transaction(request, 'deposit', lambda **kwargs: Transaction.objects.create_deposit(
+            user=user,
+            amount=request.data.get('amount'),
+            currency=request.data.get('currency'),
+            from_reference=request.data.get('from_reference'),
+            note=request.data.get('note'),
+            metadata=request.data.get('metadata', {}),
+            **kwargs))
 
-        # Execute transaction using third-party API and upload to Rehive:
-        tx.execute()
-        tx.upload_to_rehive()
-        tx.refresh_from_db()
+    def get(self, request, *args, **kwargs):
+        raise exceptions.MethodNotAllowed('GET')
 
-        return Response({'status': 'success',
-                         'data': {'tx_code': tx.rehive_code}})
+
+class BulkTransactionView(GenericAPIView):
+    """
+    Creates many transactions of `tx_type` from a list of items in one request. Items are validated in one pass,
+    valid ones are inserted with a single bulk insert in one database transaction and processed (executed and
+    uploaded) in the background once committed. Returns a result per item, so invalid items don't fail the rest of
+    the batch.
+    """
+    allowed_methods = ('POST',)
+    throttle_classes = (NoThrottling,)
+    serializer_class = BulkTransactionSerializer
+    authentication_classes = (ExternalJWTAuthentication,)
+    permission_classes = (UserPermission,)
+
+    tx_type = None
+
+    def build_transaction(self, user, item: dict) -> Transaction:
+        raise NotImplementedError('subclasses of BulkTransactionView must provide a build_transaction() method')
+
+    def dispatch_transactions(self, txs: list):
+        process_transaction_batch.delay([tx.id for tx in txs])
+
+    def get_user(self, request, item: dict):
+        return request.user
+
+    def prepare(self, items: list):
+        """
+        Hook to load data needed by all items, before they are validated and built.
+        """
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise exceptions.ValidationError({'non_field_errors': ['A list of transactions is required.']})
+
+        max_items = getattr(settings, 'ADAPTER_BULK_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            raise exceptions.ValidationError({'non_field_errors': ['At most %s transactions are allowed.' % max_items]})
+
+        self.prepare(items)
+
+        results = []
+        txs = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if not serializer.is_valid():
+                results.append({'index': index, 'status': 'invalid', 'errors': serializer.errors})
+                continue
+
+            try:
+                user = self.get_user(request, serializer.validated_data)
+            except User.DoesNotExist:
+                results.append({'index': index, 'status': 'invalid', 'errors': {'user': ['Unknown user.']}})
+                continue
+
+            try:
+                tx = self.build_transaction(user, serializer.validated_data)
+            except (AdminAccount.DoesNotExist, AdminAccount.MultipleObjectsReturned, ServiceAccount.DoesNotExist):
+                results.append({'index': index, 'status': 'invalid', 'errors': {'admin_account': ['Invalid account.']}})
+                continue
+
+            results.append({'index': index, 'status': 'accepted'})
+            txs.append(tx)
+
+        with transaction.atomic():
+            Transaction.objects.bulk_create_with_ids(txs)
+            if txs:
+                transaction.on_commit(lambda: self.dispatch_transactions(txs))
+
+        accepted = [result for result in results if result['status'] == 'accepted']
+        for result, tx in zip(accepted, txs):
+            result['id'] = tx.id
+
+        return Response({'status': 'success' if txs else 'error',
+                         'data': results},
+                        status=status.HTTP_202_ACCEPTED if txs else status.HTTP_400_BAD_REQUEST)
 
     def get(self, request, *args, **kwargs):
         raise exceptions.MethodNotAllowed('GET')
 
 
+class BulkDepositView(BulkTransactionView):
+    """
+    Bulk deposits to the authenticated user. See AdminBulkDepositView for deposits to other users.
+    """
+    tx_type = 'deposit'
+
+    def build_transaction(self, user, item: dict) -> Transaction:
+        return Transaction.objects.build_deposit(user=user,
+                                                 amount=item['amount'],
+                                                 currency=item['currency'],
+                                                 from_reference=item.get('from_reference'),
+                                                 note=item.get('note'),
+                                                 metadata=item.get('metadata', {}),
+                                                 admin_account=item.get('admin_account'))
+
+
+class AdminBulkDepositView(BulkDepositView):
+    """
+    Bulk deposits to any users, authenticated with the admin secret. Each item names the Rehive identifier of the
+    user it credits in `user`; users are loaded in one query and items for unknown users are invalid.
+    """
+    serializer_class = AdminBulkDepositSerializer
+    authentication_classes = ()
+    permission_classes = (AdminPermission,)
+
+    def prepare(self, items: list):
+        identifiers = [item['user'] for item in items if isinstance(item, dict) and isinstance(item.get('user'), str)]
+        self.users = {user.identifier: user for user in User.objects.filter(identifier__in=identifiers)}
+
+    def get_user(self, request, item: dict):
+        try:
+            return self.users[item['user']]
+        except KeyError:
+            raise User.DoesNotExist()
+
+
+class BulkWithdrawView(BulkTransactionView):
+    tx_type = 'withdraw'
+
+    def build_transaction(self, user, item: dict) -> Transaction:
+        return Transaction.objects.build_withdraw(user=user,
+                                                  amount=item['amount'],
+                                                  currency=item['currency'],
+                                                  to_reference=item.get('to_reference'),
+                                                  note=item.get('note'),
+                                                  metadata=item.get('metadata', {}),
+                                                  admin_account=item.get('admin_account'))
+
+    def dispatch_transactions(self, txs: list):
+        # One batch per admin account, so each hot wallet executes its own withdrawals in order and a slow or
+        # failing account doesn't hold up the others.
+        batches = OrderedDict()
+        for tx in txs:
+            batches.setdefault(tx.admin_account_id, []).append(tx.id)
+
+        group(process_transaction_batch.s(ids) for ids in batches.values()).apply_async()
+
+
+class TransactionStatusView(GenericAPIView):
+    """
+    Returns the status of one of the user's transactions, live or archived. Pass `?wait=<seconds>` to long-poll until
+    the transaction reaches a final status (capped by ADAPTER_STATUS_MAX_WAIT).
+
+    A waiting request holds a gunicorn sync worker for the whole wait, so a handful of pollers can occupy every
+    worker. Keep ADAPTER_STATUS_MAX_WAIT short, or set it to 0 to disable long-polling.
+    """
+    allowed_methods = ('GET',)
+    throttle_classes = (NoThrottling,)
+    serializer_class = TransactionStatusSerializer
+    authentication_classes = (ExternalJWTAuthentication,)
+    permission_classes = (UserPermission,)
+
+    def get(self, request, tx_id, *args, **kwargs):
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            wait = math.nan
+        if not math.isfinite(wait):
+            raise exceptions.ValidationError({'wait': ['A number of seconds is required.']})
+        wait = max(0.0, min(wait, getattr(settings, 'ADAPTER_STATUS_MAX_WAIT', 5)))
+
+        deadline = time.monotonic() + wait
+        queryset = Transaction.objects.filter(user=request.user).defer('metadata')
+
+        while True:
+            try:
+                tx = queryset.get(id=tx_id)
+            except Transaction.DoesNotExist:
+                # Archived transactions are final.
+                tx = ArchivedTransaction.objects.filter(user=request.user, id=tx_id) \
+                    .defer('metadata').first()
+                if tx is None:
+                    raise exceptions.NotFound()
+
+            if tx.status in Transaction.TERMINAL_STATUSES or time.monotonic() >= deadline:
+                break
+
+            remaining = max(0.0, deadline - time.monotonic())
+            time.sleep(min(getattr(settings, 'ADAPTER_STATUS_POLL_INTERVAL', 0.5), remaining))
+
+        return Response({'status': 'success',
+                         'data': self.get_serializer(tx).data})
+
+    def post(self, request, *args, **kwargs):
+        raise exceptions.MethodNotAllowed('POST')
+
+
+def get_admin_accounts(request):
+    """
+    Admin accounts, optionally filtered by `company` and `name` query parameters.
+    """
+    accounts = AdminAccount.objects.select_related('service_account').order_by('id')
+
+    if request.query_params.get('company'):
+        accounts = accounts.filter(service_account__company=request.query_params['company'])
+    if request.query_params.get('name'):
+        accounts = accounts.filter(name=request.query_params['name'])
+
+    return accounts
+
+
+def get_cached_value(value_cache, account: AdminAccount) -> tuple:
+    """
+    Returns an account's cached third-party value and None, or None and an error message if it couldn't be fetched,
+    so one misconfigured or unreachable account doesn't fail a whole list.
+    """
+    try:
+        return value_cache.get(account), None
+    except NotImplementedError:
+        return None, 'Not implemented by the %s interface.' % account.interface
+    except Exception as e:
+        logger.exception('Failed to fetch %s of admin account %s.' % (value_cache.name, account.id))
+        return None, str(e)
+
+
+def get_account_balance(account: AdminAccount) -> dict:
+    balance, error = get_cached_value(balance_cache, account)
+    if balance is None:
+        return {'balance': None, 'error': error}
+
+    return {'balance': balance['value'],
+            'age': balance['age'],
+            'stale': balance['stale']}
+
+
+class BalanceView(APIView):
+    """
+    Operating account balances. Balances are served from cache and refreshed in the background once older than
+    ADAPTER_BALANCE_MAX_AGE; `age` is the number of seconds since the balance was fetched. Accounts whose balance
+    can't be fetched have a null `balance` and an `error`.
+    """
+    allowed_methods = ('GET',)
+    throttle_classes = (NoThrottling,)
+    authentication_classes = ()
+    permission_classes = (AdminPermission,)
+
+    def post(self, request, *args, **kwargs):
+        raise exceptions.MethodNotAllowed('POST')
+
+    def get(self, request, *args, **kwargs):
+        data = []
+        for account in get_admin_accounts(request):
+            data.append(dict(get_account_balance(account), name=account.name, company=str(account.service_account)))
+
+        return Response({'status': 'success',
+                         'data': data})
+
+
 class OperatingAccountView(APIView):
+    """
+    Operating (admin) accounts with their third-party reference and cached balance. A reference or balance that
+    can't be fetched is null, with an `error`.
+    """
     allowed_methods = ('GET',)
     throttle_classes = (NoThrottling,)
     authentication_classes = ()
@@ -125,4 +465,66 @@ class OperatingAccountView(APIView):
         raise exceptions.MethodNotAllowed('POST')
 
     def get(self, request, *args, **kwargs):
-        return Response({})
+        data = []
+        for account in get_admin_accounts(request):
+            reference, error = get_cached_value(account_ref_cache, account)
+            reference = reference['value'] if reference is not None else {'reference': None, 'error': error}
+
+            data.append({'name': account.name,
+                         'type': account.type,
+                         'interface': account.interface,
+                         'default': account.default,
+                         'company': str(account.service_account),
+                         'reference': reference,
+                         'balance': get_account_balance(account)})
+
+        return Response({'status': 'success',
+                         'data': data})
+
+
+class TransactionExportView(APIView):
+    """
+    Streams transactions as CSV (default) or NDJSON (`?export_format=ndjson`), optionally filtered by `company`,
+    `status`, `tx_type` and a `since`/`until` created date range. Rows are read through a server-side cursor, so
+    exports of any size use constant memory.
+    """
+    allowed_methods = ('GET',)
+    throttle_classes = (NoThrottling,)
+    authentication_classes = ()
+    permission_classes = (AdminPermission,)
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        export_format = params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise exceptions.ValidationError({'export_format': ['Must be one of: %s.' % ', '.join(EXPORT_FORMATS)]})
+
+        dates = {}
+        for name in ('since', 'until'):
+            try:
+                dates[name] = parse_timestamp(params[name]) if params.get(name) else None
+            except ValueError as e:
+                raise exceptions.ValidationError({name: [str(e)]})
+
+        lines = export_transactions(export_format,
+                                    company=params.get('company'),
+                                    status=params.get('status'),
+                                    tx_type=params.get('tx_type'),
+                                    **dates)
+
+        response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = 'attachment; filename="transactions.%s"' % export_format
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Prometheus metrics in text exposition format.
+    """
+    allowed_methods = ('GET',)
+    throttle_classes = (NoThrottling,)
+    authentication_classes = ()
+    permission_classes = (AdminPermission,)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
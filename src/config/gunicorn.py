@@ -9,3 +9,10 @@ log_level = 'info'
 log_file = '-'
 pythonpath = '/app/'
 forwarded_allow_ips = '*'
+
+
+def child_exit(server, worker):
+    # Clean up the worker's prometheus metric files (multiprocess mode).
+    if 'prometheus_multiproc_dir' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,12 @@
+import os
+
+# Django cache, shared between gunicorn and celery processes: the Rehive circuit breaker and the operating account
+# balance cache keep their state in it. Defaults to a database table (created by the adapter migrations, or
+# `manage.py createcachetable`), point CACHE_BACKEND and CACHE_LOCATION at e.g. memcached for less database load.
+# A per process backend such as LocMemCache only trips the breaker per worker (see the adapter.W001 check).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'adapter_cache'),
+    }
+}
@@ -0,0 +1,82 @@
+import json
+import os
+
+# Rehive integration tuning
+# ---------------------------------------------------------------------------------------------------------------------#
+
+# HTTP client: timeouts in seconds, retries only apply to connection failures.
+REHIVE_CONNECT_TIMEOUT = float(os.environ.get('REHIVE_CONNECT_TIMEOUT', 3.05))
+REHIVE_READ_TIMEOUT = float(os.environ.get('REHIVE_READ_TIMEOUT', 10))
+REHIVE_MAX_RETRIES = int(os.environ.get('REHIVE_MAX_RETRIES', 2))
+REHIVE_RETRY_BACKOFF = float(os.environ.get('REHIVE_RETRY_BACKOFF', 0.2))
+REHIVE_POOL_SIZE = int(os.environ.get('REHIVE_POOL_SIZE', 10))
+
+# Circuit breaker (state in the Django cache, point CACHES at a shared backend to trip across workers).
+REHIVE_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('REHIVE_CIRCUIT_FAILURE_THRESHOLD', 20))
+REHIVE_CIRCUIT_WINDOW = int(os.environ.get('REHIVE_CIRCUIT_WINDOW', 60))
+REHIVE_CIRCUIT_RESET_TIMEOUT = int(os.environ.get('REHIVE_CIRCUIT_RESET_TIMEOUT', 30))
+
+# Upload task retries: exponential backoff with full jitter, in seconds.
+REHIVE_RETRY_BASE_DELAY = int(os.environ.get('REHIVE_RETRY_BASE_DELAY', 30))
+REHIVE_RETRY_MAX_DELAY = int(os.environ.get('REHIVE_RETRY_MAX_DELAY', 3600))
+
+# JWT verification cache (per process). Entries never outlive the token's own `exp` claim.
+REHIVE_JWT_CACHE_SIZE = int(os.environ.get('REHIVE_JWT_CACHE_SIZE', 10000))
+REHIVE_JWT_CACHE_TTL = int(os.environ.get('REHIVE_JWT_CACHE_TTL', 300))
+
+# JWT verification mode: 'remote' always asks Rehive, 'local' checks the signature against REHIVE_JWT_KEYS and
+# only falls back to Rehive for unknown keys or tokens without user claims.
+REHIVE_JWT_VERIFICATION = os.environ.get('REHIVE_JWT_VERIFICATION', 'remote')
+# JSON object mapping key ids (`kid` header) to shared secrets or PEM public keys, use "default" for tokens without kid.
+REHIVE_JWT_KEYS = json.loads(os.environ.get('REHIVE_JWT_KEYS', '{}'))
+REHIVE_JWT_ALGORITHMS = os.environ.get('REHIVE_JWT_ALGORITHMS', 'HS256').split(',')
+
+# Fingerprints of synced user profiles (per process). Unchanged profiles skip the database entirely.
+REHIVE_USER_SYNC_CACHE_SIZE = int(os.environ.get('REHIVE_USER_SYNC_CACHE_SIZE', 10000))
+REHIVE_USER_SYNC_CACHE_TTL = int(os.environ.get('REHIVE_USER_SYNC_CACHE_TTL', 300))
+
+# Deposit/withdraw submission: when async, views return 202 and execution/upload run as celery tasks.
+ADAPTER_ASYNC_TRANSACTIONS = os.environ.get('ADAPTER_ASYNC_TRANSACTIONS', '') in ['True', True, 'true']
+# Longest a status request may wait (long-poll) for a transaction to reach a final status, in seconds. Each waiting
+# request holds a sync gunicorn worker, 0 disables long-polling.
+ADAPTER_STATUS_MAX_WAIT = float(os.environ.get('ADAPTER_STATUS_MAX_WAIT', 5))
+ADAPTER_STATUS_POLL_INTERVAL = float(os.environ.get('ADAPTER_STATUS_POLL_INTERVAL', 0.5))
+
+# Batch uploader: transactions claimed per batch and concurrent Rehive calls per batch (keep <= REHIVE_POOL_SIZE).
+ADAPTER_UPLOAD_BATCH_SIZE = int(os.environ.get('ADAPTER_UPLOAD_BATCH_SIZE', 100))
+ADAPTER_UPLOAD_CONCURRENCY = int(os.environ.get('ADAPTER_UPLOAD_CONCURRENCY', 8))
+# Seconds a claimed transaction is reserved for its uploader; claims of crashed workers expire after this.
+ADAPTER_UPLOAD_LEASE = int(os.environ.get('ADAPTER_UPLOAD_LEASE', 300))
+
+# Service/admin account cache (per process, optionally backed by the shared Django cache).
+ADAPTER_ACCOUNT_CACHE_SIZE = int(os.environ.get('ADAPTER_ACCOUNT_CACHE_SIZE', 1000))
+ADAPTER_ACCOUNT_CACHE_TTL = int(os.environ.get('ADAPTER_ACCOUNT_CACHE_TTL', 60))
+ADAPTER_ACCOUNT_CACHE_SHARED = os.environ.get('ADAPTER_ACCOUNT_CACHE_SHARED', '') in ['True', True, 'true']
+
+# Third-party interface instances reused per admin account (per process).
+ADAPTER_INTERFACE_CACHE_SIZE = int(os.environ.get('ADAPTER_INTERFACE_CACHE_SIZE', 256))
+ADAPTER_INTERFACE_CACHE_TTL = int(os.environ.get('ADAPTER_INTERFACE_CACHE_TTL', 3600))
+
+# Operating account values: served from cache, refreshed in the background once older than these (seconds).
+ADAPTER_BALANCE_MAX_AGE = float(os.environ.get('ADAPTER_BALANCE_MAX_AGE', 30))
+ADAPTER_ACCOUNT_REF_MAX_AGE = float(os.environ.get('ADAPTER_ACCOUNT_REF_MAX_AGE', 3600))
+
+# Largest number of transactions accepted by a single bulk deposit/withdraw request.
+ADAPTER_BULK_MAX_ITEMS = int(os.environ.get('ADAPTER_BULK_MAX_ITEMS', 1000))
+
+# Third-party executions running at once when a worker processes a batch of transactions.
+ADAPTER_EXECUTE_CONCURRENCY = int(os.environ.get('ADAPTER_EXECUTE_CONCURRENCY', 10))
+
+# Terminal transactions not updated for this many days are moved to the archive table (0 disables archiving).
+ADAPTER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ADAPTER_ARCHIVE_AFTER_DAYS', 90))
+ADAPTER_ARCHIVE_BATCH_SIZE = int(os.environ.get('ADAPTER_ARCHIVE_BATCH_SIZE', 5000))
+
+# Store Rehive's transaction responses zlib compressed (bytea) instead of as jsonb.
+ADAPTER_COMPRESS_REHIVE_RESPONSES = os.environ.get('ADAPTER_COMPRESS_REHIVE_RESPONSES', '') in ['True', True, 'true']
+
+# Count database queries per request for the metrics endpoint (wraps the request's cursors with a counter).
+ADAPTER_METRICS_QUERY_COUNT = os.environ.get('ADAPTER_METRICS_QUERY_COUNT', '') in ['True', True, 'true']
+
+# Stellar interface: Horizon server queried for operating account balances, and its request timeout in seconds.
+STELLAR_HORIZON_URL = os.environ.get('STELLAR_HORIZON_URL', 'https://horizon.stellar.org/')
+STELLAR_HORIZON_TIMEOUT = float(os.environ.get('STELLAR_HORIZON_TIMEOUT', 10))
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 CELERY_IMPORTS = ("adapter.models",)
 
@@ -17,7 +18,19 @@ webhooks_queue = '-'.join(('webhooks', HOST_NAME))
 rehive_updates_queue = '-'.join(('rehive-updates', HOST_NAME))
 CELERY_ROUTES = {'adapter.tasks.process_webhook_receive': {'queue': webhooks_queue},
                  'adapter.tasks.confirm_rehive_transaction': {'queue': rehive_updates_queue},
-                 'adapter.tasks.create_or_confirm_rehive_receive': {'queue': rehive_updates_queue}}
+                 'adapter.tasks.create_or_confirm_rehive_receive': {'queue': rehive_updates_queue},
+                 'adapter.upload_transaction_batch.task': {'queue': rehive_updates_queue}}
+
+CELERYBEAT_SCHEDULE = {
+    'upload-transaction-batch': {
+        'task': 'adapter.upload_transaction_batch.task',
+        'schedule': timedelta(seconds=int(os.environ.get('UPLOAD_BATCH_INTERVAL', 30))),
+    },
+    'archive-transactions': {
+        'task': 'adapter.archive_transactions.task',
+        'schedule': timedelta(seconds=int(os.environ.get('ARCHIVE_INTERVAL', 60 * 60))),
+    },
+}
 
 BROKER_TRANSPORT = 'sqs'
 BROKER_TRANSPORT_OPTIONS = {
@@ -17,8 +17,10 @@ import os
 from .plugins.secrets import *
 from .plugins.rest_framework import *
 from .plugins.database import *
+from .plugins.cache import *
 from .plugins.tasks import *
 from .plugins.authentication import *
+from .plugins.rehive import *
 
 # LOGGING
 # ---------------------------------------------------------------------------------------------------------------------#
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
 # ---------------------------------------------------------------------------------------------------------------------
 
 MIDDLEWARE_CLASSES = [
+    'adapter.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',